@@ -0,0 +1,36 @@
+from tokenizers import Tokenizer
+
+from bench_token_emission import best_time
+from bench_typed_decoding import full_match
+from bracket_tokenizer import BracketTokenizer
+from token_processor import match_to_tokens
+
+# Setup
+TOKENIZER_PATH = "../model/my_tokenizer"
+NUM_MATCHES = 50  # full_match games (bench_typed_decoding.py)
+MAX_LENGTH = 8192  # As in train_neo.py
+SEED = 0
+
+# BracketTokenizer vs the Rust tokenizer behind PreTrainedTokenizerFast (my_tokenizer), on token lines
+if __name__ == "__main__":
+    texts = [" ".join(match_to_tokens(full_match(SEED + i))) for i in range(NUM_MATCHES)]
+    bracket_tokenizer = BracketTokenizer.from_pretrained(TOKENIZER_PATH)
+    hf_tokenizer = Tokenizer.from_file(f"{TOKENIZER_PATH}/tokenizer.json")
+
+    hf_time, hf_encodings = best_time(lambda: hf_tokenizer.encode_batch(texts))
+    bracket_time, (flat, offsets) = best_time(lambda: bracket_tokenizer.encode_batch(texts))
+    hf_ids = [encoding.ids for encoding in hf_encodings]
+    assert [flat[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])] == hf_ids, \
+        "BracketTokenizer ids differ from my_tokenizer"
+
+    hf_tokenizer.enable_truncation(MAX_LENGTH)
+    truncated = [encoding.ids for encoding in hf_tokenizer.encode_batch(texts)]
+    assert [row.tolist() for row in bracket_tokenizer.encode_rows(texts, max_length=MAX_LENGTH)] == truncated, \
+        "BracketTokenizer truncation differs from my_tokenizer"
+
+    num_tokens = len(flat)
+    unk = sum(token_id == bracket_tokenizer.unk_token_id for ids in hf_ids for token_id in ids[1:-1])
+    print(f"{NUM_MATCHES} matches, {num_tokens:,} ids, {unk / num_tokens:.2%} [UNK] (ids identical)")
+    print(f"hf:      {hf_time:.3f}s ({num_tokens / hf_time / 1e6:.2f}M tok/s)")
+    print(f"bracket: {bracket_time:.3f}s ({num_tokens / bracket_time / 1e6:.2f}M tok/s) | "
+          f"speedup x{hf_time / bracket_time:.2f}")
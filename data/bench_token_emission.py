@@ -0,0 +1,76 @@
+import random
+import time
+
+from token_processor import (
+    ITEM_CATEGORY_MAP, build_pid_role_map_by_team_position, replace_pid_with_roles, tokenize_match,
+)
+
+# Setup
+NUM_FRAMES = 2000
+EVENTS_PER_FRAME = 100
+REPEATS = 3
+SEED = 0
+
+POSITIONS = ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"]
+PIDS = list(range(1, 11)) + [0, None, 11]  # Unmapped ids must come out unchanged
+
+def synthetic_match(num_frames=NUM_FRAMES, events_per_frame=EVENTS_PER_FRAME, seed=SEED):
+    # A match record shaped like data.py output with every event type token_processor handles
+    rng = random.Random(seed)
+    items = [int(item_id) for item_id in ITEM_CATEGORY_MAP] + [0, 999999]
+    pid = lambda: rng.choice(PIDS)
+    makers = [
+        lambda t: {"type": "SKILL_LEVEL_UP", "participantId": pid(), "skillSlot": rng.randint(1, 5)},
+        lambda t: {"type": "ITEM_PURCHASED", "participantId": pid(), "itemId": rng.choice(items)},
+        lambda t: {"type": "ITEM_SOLD", "participantId": pid(), "itemId": rng.choice(items)},
+        lambda t: {"type": "ITEM_DESTROYED", "participantId": pid(), "itemId": rng.choice(items)},
+        lambda t: {"type": "ITEM_UNDO", "participantId": pid(), "beforeId": rng.choice(items), "afterId": 0},
+        lambda t: {"type": "WARD_PLACED", "creatorId": pid(), "wardType": "YELLOW_TRINKET"},
+        lambda t: {"type": "WARD_KILL", "killerId": pid(), "wardType": "CONTROL_WARD"},
+        lambda t: {"type": "CHAMPION_KILL", "killerId": pid(), "victimId": pid(), "bounty": 300,
+                   "assistingParticipantIds": rng.sample(range(1, 11), rng.randint(0, 4))},
+        lambda t: {"type": "CHAMPION_SPECIAL_KILL", "killerId": pid(), "killType": "KILL_MULTI",
+                   "multiKillLength": rng.randint(2, 5)},
+        lambda t: {"type": "ELITE_MONSTER_KILL", "killerId": pid(), "monsterType": rng.choice(["DRAGON", "BARON_NASHOR"]),
+                   "monsterSubType": "FIRE_DRAGON", "assistingParticipantIds": [pid()]},
+        lambda t: {"type": "BUILDING_KILL", "killerId": pid(), "buildingType": "TOWER_BUILDING",
+                   "towerType": "OUTER_TURRET", "assistingParticipantIds": [pid(), pid()]},
+        lambda t: {"type": "TURRET_PLATE_DESTROYED", "killerId": pid(), "laneType": "MID_LANE"},
+        lambda t: {"type": "LEVEL_UP", "participantId": pid(), "level": rng.randint(2, 18)},
+    ]
+
+    frames = []
+    for frame_idx in range(num_frames):
+        events = []
+        for event_idx in range(events_per_frame):
+            event = rng.choice(makers)(None)
+            event["timestamp"] = frame_idx * 60000 + event_idx * 10
+            events.append(event)
+        frames.append({"events": events})
+    frames[-1]["events"].append({"type": "GAME_END", "winningTeam": 100, "timestamp": num_frames * 60000})
+
+    participants = [{"participantId": p, "teamPosition": POSITIONS[(p - 1) % 5]} for p in range(1, 11)]
+    return {"timeline": {"info": {"frames": frames}}, "metadata": {"info": {"participants": participants}}}
+
+def best_time(fn):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+# Roles resolved at emit time vs the tokenize-then-replace pass
+if __name__ == "__main__":
+    match = synthetic_match()
+    pid_role_map = build_pid_role_map_by_team_position(match)
+
+    replace_time, replaced = best_time(
+        lambda: replace_pid_with_roles(tokenize_match(match["timeline"], ["[RANK_GOLD]"]), pid_role_map))
+    emit_time, emitted = best_time(
+        lambda: tokenize_match(match["timeline"], ["[RANK_GOLD]"], pid_role_map))
+
+    assert " ".join(emitted) == " ".join(replaced), "Emit-time roles changed the output"
+    print(f"{NUM_FRAMES * EVENTS_PER_FRAME:,} events, {len(emitted):,} tokens (output identical)")
+    print(f"tokenize + replace_pid_with_roles: {replace_time:.3f}s")
+    print(f"roles at emit time:                {emit_time:.3f}s | speedup x{replace_time / emit_time:.2f}")
@@ -0,0 +1,78 @@
+import json
+import os
+import random
+import tempfile
+
+from bench_token_emission import best_time, synthetic_match
+from token_processor import iter_json_array, match_to_tokens
+from typed_timeline import iter_typed_matches
+
+# Setup
+NUM_MATCHES = 50
+NUM_FRAMES = 35  # ~35 minute games, one frame per minute
+EVENTS_PER_FRAME = 40
+SEED = 0
+
+CHAMPION_STATS = [
+    "abilityHaste", "abilityPower", "armor", "armorPen", "armorPenPercent", "attackDamage", "attackSpeed",
+    "bonusArmorPenPercent", "bonusMagicPenPercent", "ccReduction", "cooldownReduction", "health", "healthMax",
+    "healthRegen", "lifesteal", "magicPen", "magicPenPercent", "magicResist", "movementSpeed", "omnivamp",
+    "physicalVamp", "power", "powerMax", "powerRegen", "spellVamp",
+]
+DAMAGE_STATS = [
+    "magicDamageDone", "magicDamageDoneToChampions", "magicDamageTaken", "physicalDamageDone",
+    "physicalDamageDoneToChampions", "physicalDamageTaken", "totalDamageDone", "totalDamageDoneToChampions",
+    "totalDamageTaken", "trueDamageDone", "trueDamageDoneToChampions", "trueDamageTaken",
+]
+
+def participant_frames(rng):
+    # Per-participant state as the Riot timeline has it in every frame (never read by tokenize_match)
+    return {str(pid): {
+        "participantId": pid, "level": rng.randint(1, 18), "xp": rng.randint(0, 20000),
+        "currentGold": rng.randint(0, 3000), "totalGold": rng.randint(500, 20000), "goldPerSecond": 0,
+        "minionsKilled": rng.randint(0, 300), "jungleMinionsKilled": rng.randint(0, 200),
+        "timeEnemySpentControlled": rng.randint(0, 50000),
+        "position": {"x": rng.randint(0, 14800), "y": rng.randint(0, 14800)},
+        "championStats": {key: rng.randint(0, 5000) for key in CHAMPION_STATS},
+        "damageStats": {key: rng.randint(0, 50000) for key in DAMAGE_STATS},
+    } for pid in range(1, 11)}
+
+def full_match(seed):
+    # synthetic_match plus the fields a real data.py record carries that tokenization skips
+    rng = random.Random(seed)
+    match = synthetic_match(NUM_FRAMES, EVENTS_PER_FRAME, seed)
+    for frame_idx, frame in enumerate(match["timeline"]["info"]["frames"]):
+        frame["timestamp"] = frame_idx * 60000
+        frame["participantFrames"] = participant_frames(rng)
+        for event in frame["events"]:
+            event["realTimestamp"] = 1700000000000 + event["timestamp"]
+            if event["type"] == "CHAMPION_KILL":
+                event["position"] = {"x": rng.randint(0, 14800), "y": rng.randint(0, 14800)}
+                event["victimDamageReceived"] = [{
+                    "basic": False, "magicDamage": rng.randint(0, 900), "name": "Ahri", "participantId": 3,
+                    "physicalDamage": rng.randint(0, 900), "spellName": "ahriq", "spellSlot": 0,
+                    "trueDamage": 0, "type": "OTHER",
+                } for _ in range(6)]
+    match.update(match_id=f"KR_{seed}", rank="GOLD II", region="kr", puuid="x" * 78)
+    return match
+
+# Typed schema decoding vs json dicts, on a match file shaped like data.py output
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "matches.json")
+        with open(file_path, "w") as f:
+            json.dump([full_match(SEED + i) for i in range(NUM_MATCHES)], f)
+        size_mb = os.path.getsize(file_path) / 1e6
+
+        json_decode, json_matches = best_time(lambda: list(iter_json_array(file_path)))
+        typed_decode, typed_matches = best_time(lambda: list(iter_typed_matches(file_path)))
+        json_tokenize, json_lines = best_time(lambda: [" ".join(match_to_tokens(m)) for m in json_matches])
+        typed_tokenize, typed_lines = best_time(lambda: [" ".join(match_to_tokens(m)) for m in typed_matches])
+
+    assert typed_lines == json_lines, "Typed decoding changed the output"
+    print(f"{NUM_MATCHES} matches, {size_mb:.1f} MB (output identical)")
+    print(f"decode   json: {json_decode:.3f}s ({size_mb / json_decode:.0f} MB/s) | "
+          f"typed: {typed_decode:.3f}s ({size_mb / typed_decode:.0f} MB/s) | speedup x{json_decode / typed_decode:.2f}")
+    print(f"tokenize json: {json_tokenize:.3f}s | typed: {typed_tokenize:.3f}s")
+    json_total, typed_total = json_decode + json_tokenize, typed_decode + typed_tokenize
+    print(f"total    json: {json_total:.3f}s | typed: {typed_total:.3f}s | speedup x{json_total / typed_total:.2f}")
@@ -0,0 +1,86 @@
+import json
+import os
+from array import array
+from itertools import repeat
+from typing import Dict, List, Tuple, Union
+import numpy as np
+
+from token_ids import TOKEN_DTYPE, encode_line, splits_unknown_spans
+
+# Encoder for the bracket-token format with the ids of my_tokenizer (PreTrainedTokenizerFast).
+# That tokenizer registers every vocab entry as an added token and runs three pre-tokenizer
+# passes per encode; here one regex pass per line finds the same pieces (token_ids.encode_line).
+# Used by train_neo.py and the eval scripts to encode; the HF tokenizer is still what is saved
+# with the model and what decodes generated ids.
+
+class BracketTokenizer:
+    def __init__(self, tokenizer_file: str):
+        with open(tokenizer_file, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+        self.vocab: Dict[str, int] = spec["model"]["vocab"]
+        self.ids_to_tokens = [None] * (max(self.vocab.values()) + 1)
+        for token, token_id in self.vocab.items():
+            self.ids_to_tokens[token_id] = token
+        assert len(self.ids_to_tokens) - 1 <= np.iinfo(TOKEN_DTYPE).max
+        self.unk_token_id = self.vocab[spec["model"]["unk_token"]]
+        self.pad_token_id = self.vocab["[PAD]"]
+        self.split_unknown = splits_unknown_spans(spec["pre_tokenizer"])  # How an unknown [..] is encoded
+        # BertProcessing: cls first, sep last ([UNK] ... [PAD] for my_tokenizer)
+        post = spec["post_processor"]
+        self.prefix_ids = [post["cls"][1]] if post else []
+        self.suffix_ids = [post["sep"][1]] if post else []
+
+    @classmethod
+    def from_pretrained(cls, path: str) -> "BracketTokenizer":
+        # A directory written by save_pretrained (my_tokenizer, lol-model-neox)
+        return cls(os.path.join(path, "tokenizer.json"))
+
+    @property
+    def vocab_size(self) -> int:
+        return len(self.ids_to_tokens)
+
+    def __len__(self) -> int:
+        return len(self.ids_to_tokens)
+
+    def get_vocab(self) -> Dict[str, int]:
+        return dict(self.vocab)
+
+    def encode(self, text: str, add_special_tokens: bool = True, max_length: int = None) -> List[int]:
+        # my_tokenizer(text, truncation=max_length is not None, max_length=max_length).input_ids
+        ids = encode_line(text, self.vocab, self.split_unknown)
+        if not add_special_tokens:
+            return ids if max_length is None else ids[:max_length]
+        if max_length is not None:
+            ids = ids[:max(0, max_length - len(self.prefix_ids) - len(self.suffix_ids))]
+        return self.prefix_ids + ids + self.suffix_ids
+
+    def encode_batch(self, texts: List[str], add_special_tokens: bool = True,
+                     max_length: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        # (flat ids, offsets): row i is flat[offsets[i]:offsets[i + 1]]. flat wraps the buffer
+        # the ids were appended to (no copy), and rows sliced from it are views.
+        flat = array("H")
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        for i, text in enumerate(texts):
+            flat.extend(self.encode(text, add_special_tokens, max_length))
+            offsets[i + 1] = len(flat)
+        return np.frombuffer(flat, dtype=TOKEN_DTYPE), offsets
+
+    def encode_rows(self, texts: List[str], add_special_tokens: bool = True,
+                    max_length: int = None) -> List[np.ndarray]:
+        # encode_batch as one view per text
+        flat, offsets = self.encode_batch(texts, add_special_tokens, max_length)
+        return [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def tokenize(self, text: str) -> List[str]:
+        return self.convert_ids_to_tokens(encode_line(text, self.vocab, self.split_unknown))
+
+    def convert_tokens_to_ids(self, tokens: Union[str, List[str]]) -> Union[int, List[int]]:
+        # Unknown tokens -> [UNK], as WordLevel does
+        if isinstance(tokens, str):
+            return self.vocab.get(tokens, self.unk_token_id)
+        return list(map(self.vocab.get, tokens, repeat(self.unk_token_id)))
+
+    def convert_ids_to_tokens(self, ids: Union[int, List[int]]) -> Union[str, List[str]]:
+        if isinstance(ids, (int, np.integer)):
+            return self.ids_to_tokens[ids]
+        return [self.ids_to_tokens[token_id] for token_id in ids]
@@ -0,0 +1,115 @@
+import json
+import re
+from itertools import repeat
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+# Token-id output of token_processor.py and its loaders (train_neo.py, eval scripts).
+# Matches are stored back to back in one flat uint16 file; a structured .npy index gives
+# each match's offset, length, match_id, rank and region. Both open memory-mapped.
+
+TOKENIZER_FILE = "../model/my_tokenizer/tokenizer.json"
+TOKEN_DTYPE = np.uint16
+INDEX_DTYPE = np.dtype([
+    ("match_id", "U24"), ("rank", "U16"), ("region", "U8"), ("offset", "<u8"), ("length", "<u4"),
+])
+UNK_ID = 1
+PAD_ID = 0
+
+# Every vocab entry is an added token of my_tokenizer, so known tokens are found as whole
+# [..] spans; whatever text lies between them goes through its Whitespace pre-tokenizer
+# and each piece becomes [UNK] (no piece of that kind is in the vocab)
+BRACKET_RE = re.compile(r"\[[^\[\]]+\]")
+WHITESPACE_RE = re.compile(r"\w+|[^\w\s]+")
+# Both at once, for lines whose [..] spans are all in the vocab: known tokens, and the
+# Whitespace pieces of the text between them (a [^\w\s] run stops where a [..] starts)
+PIECE_RE = re.compile(r"\[[^\[\]]+\]|\w+|(?:(?!\[[^\[\]]+\])[^\w\s])+")
+BRACKET_SPLIT_RE = re.compile(f"({BRACKET_RE.pattern})")  # Tokens and the text between them in one pass
+# Pieces of a tokenizer built by model/tokenizer.py since the vocab.py MIN_FREQUENCY cutoff: an
+# unknown [..] (without whitespace) is one piece and one [UNK], not the Whitespace pieces of it
+SPAN_PIECE_RE = re.compile(r"\[[^\[\]\s]+\]|\w+|(?:(?!\[[^\[\]\s]+\])[^\w\s])+")
+
+def load_vocab(tokenizer_file: str = TOKENIZER_FILE) -> Dict[str, int]:
+    # The ids the model was trained with (vocab.txt only takes effect after tokenizer.py)
+    with open(tokenizer_file, "r", encoding="utf-8") as f:
+        vocab = json.load(f)["model"]["vocab"]
+    assert max(vocab.values()) <= np.iinfo(TOKEN_DTYPE).max
+    return vocab
+
+def splits_unknown_spans(pre_tokenizer: Dict[str, Any]) -> bool:
+    # True for a tokenizer.json whose pre-tokenizer runs Whitespace (my_tokenizer builds before
+    # SPAN_PIECE_RE), which splits an unknown [..] into several [UNK]
+    steps = pre_tokenizer.get("pretokenizers", [pre_tokenizer]) if pre_tokenizer else []
+    return any(step["type"] == "Whitespace" for step in steps)
+
+def load_split_unknown(tokenizer_file: str = TOKENIZER_FILE) -> bool:
+    # encode_line's split_unknown for the tokenizer the model was trained with
+    with open(tokenizer_file, "r", encoding="utf-8") as f:
+        return splits_unknown_spans(json.load(f)["pre_tokenizer"])
+
+def encode_line(line: str, vocab: Dict[str, int], split_unknown: bool = True) -> List[int]:
+    # Same ids as my_tokenizer(line, add_special_tokens=False).input_ids, where split_unknown
+    # is load_split_unknown() of my_tokenizer
+    if not split_unknown:
+        return list(map(vocab.get, SPAN_PIECE_RE.findall(line), repeat(UNK_ID)))
+
+    pieces = PIECE_RE.findall(line)
+    unknown = set(pieces).difference(vocab)
+    if not any(BRACKET_RE.fullmatch(piece) for piece in unknown):
+        # One regex pass and a C-level lookup; every piece outside the vocab is text -> [UNK]
+        return list(map(vocab.get, pieces, repeat(UNK_ID)))
+
+    # An unknown [..] is part of the surrounding text: glue it and the text around it
+    # together and count the Whitespace pieces of the result
+    parts = BRACKET_SPLIT_RE.split(line)  # text, token, text, ..., text
+    ids, text = [], parts[0]
+    for token, gap in zip(parts[1::2], parts[2::2]):
+        token_id = vocab.get(token)
+        if token_id is None:
+            text += token + gap
+            continue
+        if text and not text.isspace():
+            ids.extend(repeat(UNK_ID, len(WHITESPACE_RE.findall(text))))
+        ids.append(token_id)
+        text = gap
+    if text and not text.isspace():
+        ids.extend(repeat(UNK_ID, len(WHITESPACE_RE.findall(text))))
+    return ids
+
+class TokenIdWriter:
+    # Appends one match at a time; the index is written by close()
+    def __init__(self, tokens_path: str, index_path: str):
+        self.tokens_file = open(tokens_path, "wb")
+        self.index_path = index_path
+        self.rows: List[Tuple[str, str, str, int, int]] = []
+        self.offset = 0
+
+    def write(self, ids: List[int], match_id: str, rank: str, region: str):
+        self.tokens_file.write(np.asarray(ids, dtype=TOKEN_DTYPE).tobytes())
+        self.rows.append((match_id, rank, region, self.offset, len(ids)))
+        self.offset += len(ids)
+
+    def close(self):
+        self.tokens_file.close()
+        np.save(self.index_path, np.array(self.rows, dtype=INDEX_DTYPE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load_token_ids(tokens_path: str, index_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    # (flat token memmap, index) without reading or parsing the token file
+    return np.memmap(tokens_path, dtype=TOKEN_DTYPE, mode="r"), np.load(index_path, mmap_mode="r")
+
+def match_ids(tokens: np.ndarray, entry, add_special_tokens: bool = False, max_length: int = None) -> np.ndarray:
+    # One match's ids (a view into the memmap unless specials are added). With
+    # add_special_tokens: [UNK] ... [PAD] around them and truncation to max_length,
+    # as my_tokenizer(text, truncation=True, max_length=max_length) does
+    ids = tokens[entry["offset"]:entry["offset"] + entry["length"]]
+    if not add_special_tokens:
+        return ids if max_length is None else ids[:max_length]
+    if max_length is not None:
+        ids = ids[:max_length - 2]
+    return np.concatenate([[UNK_ID], ids, [PAD_ID]]).astype(np.int64)
@@ -1,12 +1,54 @@
+import hashlib
+import inspect
 import json
-from typing import List, Dict, Any
+import os
+import sys
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Tuple
 from itertools import chain
 import glob
+import numpy as np
 
-# Find all matching files if used for batched processing
-# json_files = glob.glob("match_ranked_*.json")
+from token_ids import TokenIdWriter, encode_line, load_split_unknown, load_vocab
+try:
+    from typed_timeline import iter_typed_matches
+except ImportError:  # msgspec not installed: matches are decoded with json only
+    iter_typed_matches = None
+
+# Batched processing reads every match_ranked_*.json instead of MATCH_FILE
+BATCHED = False
 MATCH_FILE = "matches.json"
+MATCH_GLOB = "match_ranked_*.json"
 OUTPUT_FILE = "processed_tokens.txt"
+WRITE_TEXT = True  # Bracket-token text, one match per line (readable, for debugging)
+# Token ids for training/eval without re-tokenizing: a flat uint16 array plus a per-match
+# index (see token_ids.py)
+WRITE_TOKEN_IDS = False
+TOKEN_IDS_FILE = "processed_tokens.bin"
+TOKEN_INDEX_FILE = "processed_tokens_index.npy"
+READ_CHUNK_SIZE = 1 << 20  # Bytes read at a time while streaming a match array
+# Decode matches with the typed schema of typed_timeline.py (only the fields tokenization
+# reads; participantFrames etc. are skipped). Falls back to json when msgspec is missing.
+TYPED_DECODING = True
+NUM_WORKERS = os.cpu_count() or 1  # Tokenizer processes; 0 tokenizes in this process
+MAX_IN_FLIGHT = 4  # Matches queued per worker (bounds memory to a few matches per worker)
+STATS_EVERY = 1000  # Matches between throughput reports
+# Incremental mode: only new or changed matches are tokenized, each run appending one text
+# shard to SHARD_DIR. The manifest records every processed match_id with its content hash and
+# shard, plus a hash of the tokenization rules; when the rules change, everything is rebuilt.
+INCREMENTAL = False
+SHARD_DIR = "processed_shards"
+MANIFEST_FILE = "manifest.json"
+# Per-frame state block after each frame's events: every participant's total gold and XP
+# bucket, level and map zone from participantFrames (see frame_state_tokens)
+STATE_TOKENS = False
+GOLD_BINS = np.array([1000, 2000, 3000, 4500, 6000, 8000, 10000, 12500, 15000, 18000])  # totalGold bucket edges
+XP_BINS = np.array([1000, 2000, 3500, 5000, 7000, 9000, 11500, 14000, 16500])  # xp bucket edges
+MAX_LEVEL = 18
 
 # Constants for token mapping
 SKILL_MAP = {1: "Q", 2: "W", 3: "E", 4: "R"}
@@ -672,6 +714,17 @@ def replace_pid_with_roles(tokens: List[Any], pid_role_map: Dict[int, str]) -> L
         new_tokens.append(replaced_token)
     return new_tokens
 
+NO_ROLES: Dict[str, str] = {}
+
+def participant_tags(pid_role_map: Dict[int, str]) -> Dict[str, str]:
+    # [P1]...[P10] -> role tag, built once per match. Same substitution as
+    # replace_pid_with_roles: unmapped pids keep [P{pid}], others ([P0], [PNone]) are left as is.
+    return {f"[P{pid}]": f"[{pid_role_map.get(pid, f'P{pid}')}]" for pid in range(1, 11)}
+
+def participant_tag(pid: Any, tags: Dict[str, str] = NO_ROLES) -> str:
+    tag = f"[P{pid}]"
+    return tags.get(tag, tag)
+
 def get_item_category(item_id: str) -> str:
     # Get the category of an item based on its ID. 
     if item_id == 0:
@@ -679,14 +732,14 @@ def get_item_category(item_id: str) -> str:
     else :
         return ITEM_CATEGORY_MAP.get(str(item_id), f"[UNKNOWN_{item_id}]")
 
-def process_skill_level_up(event: Dict[str, Any]) -> str:
+def process_skill_level_up(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process skill level up events.
     participant_id = event["participantId"]
     skill_slot = event["skillSlot"]
     skill_name = SKILL_MAP.get(skill_slot, f"SLOT{skill_slot}")
-    return f"[SKILL_UP][P{participant_id}][SKILL_{skill_name}]"
+    return f"[SKILL_UP]{participant_tag(participant_id, tags)}[SKILL_{skill_name}]"
 
-def process_item_transaction(event: Dict[str, Any]) -> str:
+def process_item_transaction(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process item purchase, sell, undo, and destroy events. 
     participant_id = event["participantId"]
     item_id = event.get("itemId")
@@ -699,25 +752,25 @@ def process_item_transaction(event: Dict[str, Any]) -> str:
     }
     
     action = action_map.get(event["type"], "UNKNOWN_ITEM_EVENT")
-    return f"[ITEM_{action}][P{participant_id}][{item_category}]"
+    return f"[ITEM_{action}]{participant_tag(participant_id, tags)}[{item_category}]"
 
 
-def process_item_undo(event: Dict[str, Any]) -> str:
+def process_item_undo(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     participant_id = event["participantId"]
     before_item =  get_item_category(event.get("beforeId"))
     after_item = get_item_category(event.get("afterId"))
-    return f"[ITEM_UNDO][P{participant_id}][{before_item}][{after_item}]"
+    return f"[ITEM_UNDO]{participant_tag(participant_id, tags)}[{before_item}][{after_item}]"
     
 
-def process_ward_interaction(event: Dict[str, Any]) -> str:
+def process_ward_interaction(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process ward placement and kill events.
     participant_id = event.get("participantId") or event.get("killerId")
     ward_type = WARD_TYPE_MAP.get(event.get("wardType", "UNKNOWN_WARD_T"), "UNKNOWN_WARD")
 
     action = "PLACE" if event["type"] == "WARD_PLACED" else "KILL"
-    return f"[WARD_{action}][P{participant_id}][{ward_type}]"
+    return f"[WARD_{action}]{participant_tag(participant_id, tags)}[{ward_type}]"
 
-def process_combat(event: Dict[str, Any]) -> List[str]:
+def process_combat(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> List[str]:
     # Process champion kill events.
     tokens = []
     killer_id = event["killerId"]
@@ -726,20 +779,20 @@ def process_combat(event: Dict[str, Any]) -> List[str]:
     bounty = event.get("bounty", 0)
     
     tokens.append(
-        f"[KILL][P{killer_id}][P{victim_id}]"
+        f"[KILL]{participant_tag(killer_id, tags)}{participant_tag(victim_id, tags)}"
     )
     
     # Format assists
     if assists:
         tokens.append("[ASSIST]")
         for aid in assists:
-            tokens.append(f"[P{aid}]")
+            tokens.append(participant_tag(aid, tags))
     
     tokens.append(f"[BOUNTY][{bounty}]")
     return tokens
 
 
-def process_building(event: Dict[str, Any]) -> str:
+def process_building(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process building kill events with strategic weights.
     tokens = []
     building_type = event.get("buildingType", "").replace("_BUILDING", "")
@@ -752,43 +805,67 @@ def process_building(event: Dict[str, Any]) -> str:
         tower_type = event.get("towerType", "UNKNOWN_TOWER").replace("_TURRET", "")
         tokens.append(f"[{tower_type}]")
         
-    tokens.append(f"[P{killer_id}]")
+    tokens.append(participant_tag(killer_id, tags))
     
     if assists:
         tokens.append("[ASSIST]")
         for aid in assists:
-            tokens.append(f"[P{aid}]")
+            tokens.append(participant_tag(aid, tags))
   
     return tokens
 
+DEFAULT_LOCATION = "JUNGLE"  # Default to jungle for other areas
+
+def location_conditions(x: Any, y: Any) -> List[Tuple[str, Any]]:
+    # Map zones in priority order (the first that holds wins). x and y are numbers or
+    # NumPy arrays, so process_position and frame_state_tokens share the same rules.
+    return [
+        ("BOT_LANE", (x < 6000) & (y < 6000)),
+        ("MID_LANE", abs(x - y) < 1000),  # Within ~1000 units of diagonal
+        ("DRAGON_PIT", (9300 <= x) & (x <= 10300) & (3900 <= y) & (y <= 4900)),
+        ("BARON_PIT", (4500 <= x) & (x <= 5500) & (9900 <= y) & (y <= 10900)),
+        ("TOP_LANE", y > 8000),  # Top lane can be inferred from high y values
+    ]
+
 def process_position(event: Dict[str, Any]) -> str:
-    # Process position events. 
+    # Process position events.
     position = event.get("position", {})
     x, y = position.get("x", 0), position.get("y", 0)
-    
+
     # Determine location type based on coordinates
-    location = "UNKNOWN_LOCATION"
-    
-    # Bot lane
-    if x < 6000 and y < 6000:
-        location = "BOT_LANE"
-    # Mid lane - diagonal range
-    elif abs(x - y) < 1000:  # Within ~1000 units of diagonal
-        location = "MID_LANE"
-    # Dragon pit
-    elif 9300 <= x <= 10300 and 3900 <= y <= 4900:
-        location = "DRAGON_PIT"
-    # Baron pit
-    elif 4500 <= x <= 5500 and 9900 <= y <= 10900:
-        location = "BARON_PIT"
-    # Top lane can be inferred from high y values
-    elif y > 8000:
-        location = "TOP_LANE"
-    else:
-        location = "JUNGLE"  # Default to jungle for other areas
-    
+    location = next((zone for zone, inside in location_conditions(x, y) if inside), DEFAULT_LOCATION)
+
     return f"[POS][{location}][{x},{y}]"
 
+PARTICIPANT_KEYS = [str(pid) for pid in range(1, 11)]  # participantFrames keys
+GOLD_TOKENS = np.array([f"[GOLD_{i}]" for i in range(len(GOLD_BINS) + 1)], dtype=object)
+XP_TOKENS = np.array([f"[XP_{i}]" for i in range(len(XP_BINS) + 1)], dtype=object)
+LEVEL_TOKENS = np.array([f"[{level}]" for level in range(MAX_LEVEL + 1)], dtype=object)  # As in [LEVEL_UP]
+
+def frame_state_tokens(frames: List[Dict[str, Any]], tags: Dict[str, str] = NO_ROLES) -> List[List[str]]:
+    # State block of every frame: [FRAME_STATE], then one token string per participant in the
+    # frame's participantFrames, e.g. [TOP_B][GOLD_3][XP_2][7][BOT_LANE]. The fields of all
+    # frames are gathered once into [frames x 10] arrays and bucketed/zoned together.
+    # [FRAME_STATE] starts with [FRAME, so eval_surprise treats it as an event boundary and
+    # the role tags in the block are not scored.
+    missing = {}
+    state = np.array([
+        [(pf.get("totalGold", 0), pf.get("xp", 0), pf.get("level", 0),
+          pf.get("position", missing).get("x", 0), pf.get("position", missing).get("y", 0), pf is not missing)
+         for pf in (frame.get("participantFrames", missing).get(key, missing) for key in PARTICIPANT_KEYS)]
+        for frame in frames
+    ], dtype=np.int64).reshape(len(frames), len(PARTICIPANT_KEYS), 6)
+    gold, xp, level, x, y, present = np.moveaxis(state, -1, 0)
+
+    zones = location_conditions(x, y)
+    zone_tokens = np.array([f"[{zone}]" for zone, _ in zones] + [f"[{DEFAULT_LOCATION}]"], dtype=object)
+    zone = np.select([inside for _, inside in zones], np.arange(len(zones)), default=len(zones))
+    role_tags = np.array([participant_tag(pid, tags) for pid in range(1, 11)], dtype=object)
+
+    blocks = (role_tags + GOLD_TOKENS[np.digitize(gold, GOLD_BINS)] + XP_TOKENS[np.digitize(xp, XP_BINS)]
+              + LEVEL_TOKENS[np.clip(level, 0, MAX_LEVEL)] + zone_tokens[zone])
+    return [["[FRAME_STATE]"] + row[mask].tolist() for row, mask in zip(blocks, present.astype(bool))]
+
 def process_game_state(event: Dict[str, Any]) -> str:
     # Process game state events.
     if event["type"] == "GAME_END":
@@ -796,7 +873,7 @@ def process_game_state(event: Dict[str, Any]) -> str:
         return f"[GAME_END][TEAM{winning_team}]"
     return ""
 
-def process_special_kill(event: Dict[str, Any]) -> str:
+def process_special_kill(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process special kill events (multi-kills, first blood, etc.). 
     killer_id = event["killerId"]
     kill_type = event.get("killType", "NORMAL")
@@ -811,9 +888,9 @@ def process_special_kill(event: Dict[str, Any]) -> str:
         elif streak == 5:
             kill_type = "PENTA_KILL"
     
-    return f"[SPECIAL_{kill_type}][P{killer_id}]"
+    return f"[SPECIAL_{kill_type}]{participant_tag(killer_id, tags)}"
 
-def process_elite_monster(event: Dict[str, Any]) -> str:
+def process_elite_monster(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process elite monster kill events with strategic weights.
     tokens = []
     monster_type = event.get("monsterType", "UNKNOWN_MON")
@@ -826,65 +903,74 @@ def process_elite_monster(event: Dict[str, Any]) -> str:
         monster_subtype = event.get("monsterSubType", "UNKNOWN_MON_S2")
         tokens.append(f"[{monster_subtype}]")
         
-    tokens.append(f"[P{killer_id}]")
+    tokens.append(participant_tag(killer_id, tags))
     
     if assists:
         tokens.append("[ASSIST]")
         for aid in assists:
-            tokens.append(f"[P{aid}]")
+            tokens.append(participant_tag(aid, tags))
     return tokens
 
-def process_turret_plate(event: Dict[str, Any]) -> str:
+def process_turret_plate(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process turret plate destruction events.
     killer_id = event.get("killerId")
     lane_type = event.get("laneType", "UNKNOWN_LANE")
-    return f"[BUILDING_PLATE][{lane_type}][P{killer_id}]"
+    return f"[BUILDING_PLATE][{lane_type}]{participant_tag(killer_id, tags)}"
 
-def process_level_up(event: Dict[str, Any]) -> str:
+def process_level_up(event: Dict[str, Any], tags: Dict[str, str] = NO_ROLES) -> str:
     # Process level up events.
     participant_id = event["participantId"]
     level = event.get("level", 0)
-    return f"[LEVEL_UP][P{participant_id}][{level}]"
+    return f"[LEVEL_UP]{participant_tag(participant_id, tags)}[{level}]"
 
 def normalize_rank(full_rank: str) -> str:
     # Extracts the rank tier from a full rank like 'DIAMOND I' or 'GOLD IV'.
     return full_rank.split()[0] if full_rank and isinstance(full_rank, str) else "UNRANKED"
 
-def tokenize_match(timeline_json: Dict[str, Any], tokens: List[str]) -> List[str]:
+def tokenize_match(timeline_json: Dict[str, Any], tokens: List[str],
+                   pid_role_map: Dict[int, str] = None, state_tokens: bool = False) -> List[str]:
+    # With pid_role_map, participants are written as roles directly (no replace_pid_with_roles pass).
+    # With state_tokens, each frame's events are followed by its frame_state_tokens block.
+    tags = participant_tags(pid_role_map) if pid_role_map is not None else NO_ROLES
     tokens.append("[GAME_START]")
     last_kill_time = 0
 
-    for frame in timeline_json["info"]["frames"]:
+    frames = timeline_json["info"]["frames"]
+    states = frame_state_tokens(frames, tags) if state_tokens else None
+    for frame_idx, frame in enumerate(frames):
         tokens.append("[FRAME]")
         for event in frame.get("events", []):
             event_type = event.get("type")
             timestamp = event.get("timestamp", 0)
 
             if event_type == "SKILL_LEVEL_UP":
-                tokens.append(process_skill_level_up(event))
+                tokens.append(process_skill_level_up(event, tags))
             elif event_type == "ITEM_UNDO":
-                tokens.append(process_item_undo(event))
+                tokens.append(process_item_undo(event, tags))
             elif event_type in ["ITEM_PURCHASED", "ITEM_SOLD", "ITEM_DESTROYED"]:
-                tokens.append(process_item_transaction(event))
+                tokens.append(process_item_transaction(event, tags))
             elif event_type in ["WARD_PLACED", "WARD_KILL"]:
-                tokens.append(process_ward_interaction(event))
+                tokens.append(process_ward_interaction(event, tags))
             elif event_type == "CHAMPION_KILL":
-                tokens.extend(process_combat(event))  # already returns a list
+                tokens.extend(process_combat(event, tags))  # already returns a list
                 last_kill_time = timestamp
             elif event_type == "CHAMPION_SPECIAL_KILL":
                 if timestamp - last_kill_time < 1000:
-                    tokens.append(process_special_kill(event))
+                    tokens.append(process_special_kill(event, tags))
             elif event_type == "ELITE_MONSTER_KILL":
-                tokens.extend(process_elite_monster(event))  # already returns a list
+                tokens.extend(process_elite_monster(event, tags))  # already returns a list
             elif event_type == "BUILDING_KILL":
-                tokens.extend(process_building(event))  # already returns a list
+                tokens.extend(process_building(event, tags))  # already returns a list
             elif event_type == "TURRET_PLATE_DESTROYED":
-                tokens.append(process_turret_plate(event))
+                tokens.append(process_turret_plate(event, tags))
             elif event_type == "LEVEL_UP":
-                tokens.append(process_level_up(event))
+                tokens.append(process_level_up(event, tags))
             elif event_type == "GAME_END":
                 tokens.append(process_game_state(event))
 
+        if states is not None:
+            tokens.extend(states[frame_idx])
+
     return tokens
 
 def process_match_file(file_path: str) -> List[str]:
@@ -910,35 +996,253 @@ def save_tokens_for_training(tokens_by_match: List[List[str]], output_file: str)
             # Join tokens for this match with spaces and write to file
             f.write(" ".join(flat_tokens) + "\n")
 
+def iter_json_array(file_path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    # Yields the items of a top-level JSON array one at a time (the shape data.py writes),
+    # so only the item being decoded is held in memory, never the whole file.
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buffer, pos, eof = "", 0, False
+        read_size = chunk_size
+
+        def fill():
+            nonlocal buffer, pos, eof, read_size
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip(chars):
+            # Advance past whitespace and the given separators, reading more as needed
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in chars):
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        skip("")
+        if buffer[pos:pos + 1] != "[":
+            raise ValueError(f"{file_path}: expected a JSON array")
+        pos += 1
+
+        while True:
+            skip(",")
+            if pos >= len(buffer) or buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Item not complete yet; double the read so a large match costs O(size) overall
+                fill()
+                read_size *= 2
+                continue
+            yield item
+            pos, read_size = end, chunk_size
+
+def iter_matches(file_paths: List[str], typed: bool = TYPED_DECODING) -> Iterator[Dict[str, Any]]:
+    # Match records from every file, in file order
+    if typed and iter_typed_matches is not None:
+        iter_file = partial(iter_typed_matches, frame_state=STATE_TOKENS)
+    else:
+        iter_file = iter_json_array
+    for file_path in file_paths:
+        print(f"Processing {file_path}...")
+        yield from iter_file(file_path)
+
+def match_to_tokens(match: Dict[str, Any]) -> List[str]:
+    # Flat token list of one match record: rank, timeline events, participants as roles
+    rank = normalize_rank(match["rank"])
+    tokens = [f"[RANK_{rank}]"]
+    pid_role_map = build_pid_role_map_by_team_position(match)
+    return tokenize_match(match["timeline"], tokens, pid_role_map, STATE_TOKENS)
+
+class TokenizedMatch(NamedTuple):
+    line: Optional[str]  # None when the match was already processed with this content
+    ids: Optional[List[int]]  # Only when a vocab was given
+    num_tokens: int
+    match_id: str
+    rank: str
+    region: str
+    content_hash: Optional[str]  # Only in incremental mode
+    worker: int
+    seconds: float
+
+def match_content_hash(match: Dict[str, Any]) -> str:
+    # Typed records hash only the fields tokenization reads, so toggling TYPED_DECODING makes
+    # every match look changed once (they are re-tokenized, with the same output)
+    return hashlib.sha1(json.dumps(match, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+
+def tokenize_job(match: Dict[str, Any], known_hash: Optional[str] = None, vocab: Dict[str, int] = None,
+                 incremental: bool = False, split_unknown: bool = True) -> TokenizedMatch:
+    # Worker side: one match as text (and ids), plus who did it and how long it took.
+    # Incremental: a match whose content hash equals known_hash is not tokenized again.
+    start = time.perf_counter()
+    content_hash = match_content_hash(match) if incremental else None
+    line, ids, num_tokens = None, None, 0
+    if content_hash is None or content_hash != known_hash:
+        match_tokens = match_to_tokens(match)
+        line, num_tokens = " ".join(match_tokens), len(match_tokens)
+        ids = encode_line(line, vocab, split_unknown) if vocab is not None else None
+    return TokenizedMatch(line, ids, num_tokens, match["match_id"], normalize_rank(match["rank"]),
+                          match.get("region", ""), content_hash, os.getpid(), time.perf_counter() - start)
+
+def tokenize_matches(matches: Iterator[Dict[str, Any]], num_workers: int = NUM_WORKERS,
+                     max_in_flight: int = MAX_IN_FLIGHT, vocab: Dict[str, int] = None,
+                     known_hashes: Dict[str, str] = None, split_unknown: bool = True) -> Iterator[TokenizedMatch]:
+    # tokenize_job results in input order. At most num_workers * max_in_flight matches are
+    # submitted but not yet written, so a slow match holds back output without growing memory.
+    # With known_hashes (match_id -> content hash) matches are hashed and unchanged ones skipped.
+    job = partial(tokenize_job, vocab=vocab, incremental=known_hashes is not None, split_unknown=split_unknown)
+    known_hashes = known_hashes or {}
+    if num_workers == 0:
+        yield from (job(match, known_hashes.get(match["match_id"])) for match in matches)
+        return
+
+    with ProcessPoolExecutor(num_workers) as pool:
+        pending = deque()
+        for match in matches:
+            pending.append(pool.submit(job, match, known_hashes.get(match["match_id"])))
+            if len(pending) >= num_workers * max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def print_worker_stats(worker_stats: Dict[int, List[float]], elapsed: float):
+    total_matches = sum(matches for matches, _, _ in worker_stats.values())
+    total_tokens = sum(tokens for _, tokens, _ in worker_stats.values())
+    print(f"{total_matches} matches | {total_tokens / elapsed:,.0f} tokens/s overall")
+    for pid, (matches, tokens, busy) in sorted(worker_stats.items()):
+        print(f"   worker {pid}: {matches} matches | {tokens / max(busy, 1e-9):,.0f} tokens/s "
+              f"| busy {busy / elapsed:.0%}")
+
+TOKENIZER_FUNCTIONS = {
+    "build_pid_role_map_by_team_position", "participant_tags", "participant_tag", "get_item_category",
+    "normalize_rank", "tokenize_match", "match_to_tokens", "location_conditions", "frame_state_tokens",
+}
+
+def tokenizer_version() -> str:
+    # Hash of everything that decides the token text: the lookup tables, the module constants
+    # the token strings are built from and the source of the tokenization functions (tuning
+    # constants and the main block are left out)
+    module = sys.modules[__name__]
+    digest = hashlib.sha256()
+    for table in (SKILL_MAP, WARD_TYPE_MAP, ITEM_CATEGORY_MAP):
+        digest.update(json.dumps(table, sort_keys=True).encode("utf-8"))
+    digest.update(json.dumps([
+        STATE_TOKENS, GOLD_BINS.tolist(), XP_BINS.tolist(), MAX_LEVEL, DEFAULT_LOCATION, PARTICIPANT_KEYS,
+        GOLD_TOKENS.tolist(), XP_TOKENS.tolist(), LEVEL_TOKENS.tolist(),
+    ]).encode("utf-8"))
+    for name, fn in sorted(inspect.getmembers(module, inspect.isfunction)):
+        if fn.__module__ == module.__name__ and (name.startswith("process_") or name in TOKENIZER_FUNCTIONS):
+            digest.update(inspect.getsource(fn).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def write_json_atomic(path: str, data: Any):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_manifest(shard_dir: str, version: str) -> Dict[str, Any]:
+    # Manifest of shard_dir; if it was built with other tokenization rules, its shards are
+    # deleted and an empty manifest is returned, so the run rebuilds everything
+    os.makedirs(shard_dir, exist_ok=True)
+    path = os.path.join(shard_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest["tokenizer_version"] == version:
+            return manifest
+        print(f"Tokenization rules changed ({manifest['tokenizer_version']} -> {version}), rebuilding")
+        for shard in manifest["shards"]:
+            for suffix in (".txt", ".ids"):
+                if os.path.exists(os.path.join(shard_dir, shard + suffix)):
+                    os.remove(os.path.join(shard_dir, shard + suffix))
+    return {"tokenizer_version": version, "shards": [], "matches": {}}
+
+def drop_from_shards(shard_dir: str, shards: List[str], match_ids: set):
+    # Rewrites the given shards without the lines of match_ids (superseded by a newer shard).
+    # Each shard_XXXXX.txt has a shard_XXXXX.ids file with the match_id of every line.
+    for shard in shards:
+        txt_path, ids_path = os.path.join(shard_dir, shard + ".txt"), os.path.join(shard_dir, shard + ".ids")
+        with open(txt_path, "r") as txt_in, open(ids_path, "r") as ids_in, \
+                open(txt_path + ".tmp", "w") as txt_out, open(ids_path + ".tmp", "w") as ids_out:
+            for line, match_id in zip(txt_in, ids_in):
+                if match_id.rstrip("\n") not in match_ids:
+                    txt_out.write(line)
+                    ids_out.write(match_id)
+        os.replace(txt_path + ".tmp", txt_path)
+        os.replace(ids_path + ".tmp", ids_path)
+
+def run_incremental(file_paths: List[str], shard_dir: str = SHARD_DIR):
+    manifest = load_manifest(shard_dir, tokenizer_version())
+    known = manifest["matches"]  # match_id -> [content hash, shard]
+    shard = f"shard_{len(manifest['shards']):05d}"
+    txt_path, ids_path = os.path.join(shard_dir, shard + ".txt"), os.path.join(shard_dir, shard + ".ids")
+
+    added, changed, skipped = {}, set(), 0
+    with open(txt_path, "w") as txt_file, open(ids_path, "w") as ids_file:
+        results = tokenize_matches(iter_matches(file_paths), known_hashes={k: v[0] for k, v in known.items()})
+        for result in results:
+            if result.line is None or result.match_id in added:  # Unchanged, or repeated in this run
+                skipped += 1
+                continue
+            if result.match_id in known:
+                changed.add(result.match_id)
+            txt_file.write(result.line + "\n")
+            ids_file.write(result.match_id + "\n")
+            added[result.match_id] = [result.content_hash, shard]
+
+    # Changed matches keep only their newest line
+    drop_from_shards(shard_dir, sorted({known[m][1] for m in changed}), changed)
+
+    if added:
+        manifest["shards"].append(shard)
+        known.update(added)
+        write_json_atomic(os.path.join(shard_dir, MANIFEST_FILE), manifest)
+    else:
+        os.remove(txt_path)
+        os.remove(ids_path)
+    print(f"\n{len(added)} new or changed matches written to {shard if added else 'no shard'} "
+          f"({len(changed)} changed, {skipped} unchanged or repeated skipped); {len(known)} matches in {shard_dir}")
+
 if __name__ == "__main__":
+    file_paths = sorted(glob.glob(MATCH_GLOB)) if BATCHED else [MATCH_FILE]
+    if INCREMENTAL:
+        run_incremental(file_paths)
+        sys.exit()
+
+    # Matches are streamed from the JSON arrays, tokenized in worker processes and written in
+    # input order as soon as they are done, so memory stays bounded by the in-flight matches
+    worker_stats = defaultdict(lambda: [0, 0, 0.0])  # pid -> [matches, tokens, busy seconds]
+    num_matches, num_tokens = 0, 0
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        text_file = stack.enter_context(open(OUTPUT_FILE, "w")) if WRITE_TEXT else None
+        id_writer = stack.enter_context(TokenIdWriter(TOKEN_IDS_FILE, TOKEN_INDEX_FILE)) if WRITE_TOKEN_IDS else None
+        vocab = load_vocab() if WRITE_TOKEN_IDS else None
+        split_unknown = load_split_unknown() if WRITE_TOKEN_IDS else True
+
+        for result in tokenize_matches(iter_matches(file_paths), vocab=vocab, split_unknown=split_unknown):
+            if text_file:
+                text_file.write(result.line + "\n")
+            if id_writer:
+                id_writer.write(result.ids, result.match_id, result.rank, result.region)
+
+            num_matches += 1
+            num_tokens += result.num_tokens
+            stats = worker_stats[result.worker]
+            stats[0] += 1
+            stats[1] += result.num_tokens
+            stats[2] += result.seconds
+            if num_matches % STATS_EVERY == 0:
+                print_worker_stats(worker_stats, time.perf_counter() - start)
 
-    # Enable for batched processing
-    # all_matches = []
-    # for filename in json_files:
-    #     print(f"Processing {filename}...")
-    #     with open(filename, 'r') as f:
-    #         matches = json.load(f)
-    #         all_matches.extend(matches)
-
-    with open(MATCH_FILE, 'r') as f:
-        matches = json.load(f)
-    # Keep tokens separated by match
-    all_match_tokens = []
-    for match in matches:
-        rank = normalize_rank(match["rank"])
-        tokens = [f"[RANK_{rank}]"]
-        match_tokens = tokenize_match(match["timeline"], tokens)
-
-        pid_role_map = build_pid_role_map_by_team_position(match)
-        match_tokens = replace_pid_with_roles(match_tokens, pid_role_map)
-
-        all_match_tokens.append(match_tokens)
-        print(f"Processed match {match['match_id']} - {len(match_tokens)} tokens")
-    
-    # Save tokens in training format
-    save_tokens_for_training(all_match_tokens, OUTPUT_FILE)
-    
     # Print summary
-    print(f"\nProcessed {len(all_match_tokens)} matches")
-    print(f"Average tokens per match: {sum(len(tokens) for tokens in all_match_tokens) / len(all_match_tokens):.2f}")
-    print(f"Total tokens: {sum(len(tokens) for tokens in all_match_tokens)}") 
\ No newline at end of file
+    print_worker_stats(worker_stats, time.perf_counter() - start)
+    print(f"\nProcessed {num_matches} matches")
+    print(f"Average tokens per match: {num_tokens / max(1, num_matches):.2f}")
+    print(f"Total tokens: {num_tokens}")
@@ -0,0 +1,113 @@
+import json
+import mmap
+from typing import Any, Dict, Iterator, List, Optional, TypedDict
+import msgspec
+
+# Schema-driven decoding of match records for token_processor.py (needs msgspec).
+# Only the fields tokenize_match, the process_* helpers and build_pid_role_map_by_team_position
+# read are declared; everything else (participantFrames, victimDamageDealt, positions, puuid, ...)
+# is skipped by the decoder without building Python objects. The records are plain dicts
+# missing the keys that were skipped or absent, so the helpers run on them unchanged.
+
+class Event(TypedDict, total=False):
+    type: str
+    timestamp: int
+    participantId: Optional[int]
+    creatorId: Optional[int]
+    killerId: Optional[int]
+    victimId: Optional[int]
+    assistingParticipantIds: List[Optional[int]]
+    skillSlot: int
+    itemId: int
+    beforeId: int
+    afterId: int
+    wardType: str
+    bounty: int
+    killType: str
+    multiKillLength: int
+    monsterType: str
+    monsterSubType: str
+    buildingType: str
+    towerType: str
+    laneType: str
+    level: int
+    winningTeam: int
+
+class Frame(TypedDict, total=False):
+    events: List[Event]
+
+class TimelineInfo(TypedDict):
+    frames: List[Frame]
+
+class Timeline(TypedDict):
+    info: TimelineInfo
+
+class Participant(TypedDict, total=False):
+    participantId: Optional[int]
+    teamPosition: str
+
+class MetadataInfo(TypedDict, total=False):
+    participants: List[Participant]
+
+class Metadata(TypedDict):
+    info: MetadataInfo
+
+class Match(TypedDict, total=False):
+    match_id: str
+    rank: Optional[str]
+    region: str
+    timeline: Timeline
+    metadata: Metadata
+
+# With frame state tokens (token_processor.STATE_TOKENS) the participantFrames fields
+# frame_state_tokens reads are decoded too
+class Position(TypedDict, total=False):
+    x: int
+    y: int
+
+class ParticipantFrame(TypedDict, total=False):
+    totalGold: int
+    xp: int
+    level: int
+    position: Position
+
+class StateFrame(Frame, total=False):
+    participantFrames: Dict[str, ParticipantFrame]
+
+class StateTimelineInfo(TypedDict):
+    frames: List[StateFrame]
+
+class StateTimeline(TypedDict):
+    info: StateTimelineInfo
+
+class StateMatch(Match, total=False):
+    timeline: StateTimeline
+
+MATCH_DECODER = msgspec.json.Decoder(Match)
+STATE_MATCH_DECODER = msgspec.json.Decoder(StateMatch)
+RAW_ARRAY_DECODER = msgspec.json.Decoder(List[msgspec.Raw])
+
+def decode_match(data: bytes, frame_state: bool = False) -> Dict[str, Any]:
+    # A match that does not fit the schema (a field of an unexpected type) is decoded
+    # in full with json instead, so it is tokenized exactly as before
+    try:
+        return (STATE_MATCH_DECODER if frame_state else MATCH_DECODER).decode(data)
+    except msgspec.ValidationError:
+        return json.loads(bytes(data))
+
+def iter_typed_matches(file_path: str, frame_state: bool = False) -> Iterator[Dict[str, Any]]:
+    # Items of a top-level JSON array (the shape data.py writes), decoded one at a time.
+    # The file is memory-mapped and split into raw per-match spans that point into the map,
+    # so only the match being decoded is held in memory.
+    with open(file_path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            raise ValueError(f"{file_path}: expected a JSON array")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            items = RAW_ARRAY_DECODER.decode(buf)
+            try:
+                for i in range(len(items)):
+                    match = decode_match(items[i], frame_state)
+                    items[i] = None
+                    yield match
+            finally:
+                items.clear()  # The spans reference the map, which cannot close while they live
@@ -1,23 +1,103 @@
-import re
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 
-input_file = "processed_tokens.txt" 
-output_vocab = "vocab.txt"
+from token_ids import BRACKET_SPLIT_RE, WHITESPACE_RE
 
-# Extract tokens like [SKILL_Q], [P2], etc.
-token_pattern = re.compile(r"\[[^\[\]]+?\]")
-token_set = set()
-
-with open(input_file, "r") as f:
-    for line in f:
-        tokens = token_pattern.findall(line)
-        token_set.update(tokens)
+# Setup
+INPUT_FILES = ["processed_tokens.txt"]  # Or the shards: sorted(glob.glob("processed_shards/*.txt"))
+OUTPUT_VOCAB = "vocab.txt"
+COUNTS_FILE = "vocab_counts.tsv"  # token<TAB>count, in id order
+MIN_FREQUENCY = 1  # Tokens seen fewer times are left out of the vocab and become one [UNK] each
+NUM_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 64 << 20  # Bytes of the input each worker task counts
 
 # Add special tokens
-special_tokens = ["[PAD]", "[UNK]"]
-all_tokens = special_tokens + sorted(token_set)
+SPECIAL_TOKENS = ["[PAD]", "[UNK]"]
+
+def chunk_ranges(file_path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[str, int, int]]:
+    # (file, start, end) byte ranges of about chunk_size that start and end on line boundaries
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with open(file_path, "rb") as f:
+        while bounds[-1] < size:
+            f.seek(min(bounds[-1] + chunk_size, size))
+            f.readline()  # Move to the start of the next line
+            bounds.append(min(f.tell(), size))
+    return [(file_path, start, end) for start, end in zip(bounds, bounds[1:])]
+
+def count_chunk(chunk: Tuple[str, int, int]) -> Tuple[Counter, int]:
+    # Token counts of one range, read a line at a time, and the number of text pieces
+    # outside [..] tokens (my_tokenizer turns each into an [UNK] whatever the vocab)
+    file_path, start, end = chunk
+    counts, fragments = Counter(), 0
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            parts = BRACKET_SPLIT_RE.split(line.decode("utf-8"))  # text, token, text, ..., text
+            counts.update(parts[1::2])
+            gaps = " ".join(parts[::2])
+            if not gaps.isspace():
+                fragments += len(WHITESPACE_RE.findall(gaps))
+    return counts, fragments
+
+def count_tokens(file_paths: List[str], num_workers: int = NUM_WORKERS) -> Tuple[Counter, int]:
+    chunks = [chunk for file_path in file_paths for chunk in chunk_ranges(file_path)]
+    # Chunks are counted in num_workers processes (0 counts in this process) and merged
+    counts, fragments = Counter(), 0
+    if num_workers <= 0:
+        for chunk_counts, chunk_fragments in map(count_chunk, chunks):
+            counts.update(chunk_counts)
+            fragments += chunk_fragments
+        return counts, fragments
+
+    with ProcessPoolExecutor(num_workers) as pool:
+        for chunk_counts, chunk_fragments in pool.map(count_chunk, chunks):
+            counts.update(chunk_counts)
+            fragments += chunk_fragments
+    return counts, fragments
+
+def build_vocab(counts: Counter, min_frequency: int = MIN_FREQUENCY) -> List[str]:
+    # Special tokens first (fixed ids), then the kept tokens from most to least frequent
+    kept = [token for token, count in counts.items() if count >= min_frequency and token not in SPECIAL_TOKENS]
+    return SPECIAL_TOKENS + sorted(kept, key=lambda token: (-counts[token], token))
+
+def unk_rate(counts: Counter, fragments: int, vocab: List[str]) -> Tuple[int, int]:
+    # ([UNK] ids, total ids) the vocab gives the counted corpus with a tokenizer rebuilt by
+    # model/tokenizer.py: a left-out [..] token is a single [UNK], so total does not grow
+    # with the cutoff. (A [..] with whitespace in it is split there, one [UNK] per piece.)
+    in_vocab = set(vocab)
+    unk, total = fragments, fragments
+    for token, count in counts.items():
+        if token in in_vocab:
+            total += count
+        else:
+            pieces = count * (len(WHITESPACE_RE.findall(token)) if len(token.split()) > 1 else 1)
+            unk += pieces
+            total += pieces
+    return unk, total
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    counts, fragments = count_tokens(INPUT_FILES)
+    all_tokens = build_vocab(counts)
 
-with open(output_vocab, "w") as f:
-    for token in all_tokens:
-        f.write(token + "\n")
+    with open(OUTPUT_VOCAB, "w") as f:
+        for token in all_tokens:
+            f.write(token + "\n")
+    with open(COUNTS_FILE, "w") as f:
+        for token in all_tokens:
+            f.write(f"{token}\t{counts[token]}\n")
 
-print(f"Extracted {len(all_tokens)} tokens to {output_vocab}")
+    unk, total = unk_rate(counts, fragments, all_tokens)
+    print(f"Counted {sum(counts.values()):,} tokens ({len(counts):,} distinct) in {time.perf_counter() - start:.1f}s")
+    print(f"Extracted {len(all_tokens)} tokens to {OUTPUT_VOCAB} "
+          f"({sum(count < MIN_FREQUENCY for count in counts.values())} below MIN_FREQUENCY={MIN_FREQUENCY})")
+    print(f"[UNK] rate: {unk / max(1, total):.4%} ({unk:,} of {total:,} ids, {fragments:,} from text outside [..])")
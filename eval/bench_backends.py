@@ -0,0 +1,53 @@
+import os
+import time
+import numpy as np
+import torch
+from datasets import load_dataset
+
+import eval_surprise
+from eval_surprise import BATCH_TOKEN_BUDGET, MODEL_PATH, ROLE_COLUMNS, custom_split, evaluate_surprise_batched, evaluate_surprise_single_pass
+from inference import BACKEND, OnnxBackend, onnx_path, export_onnx
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+NUM_MATCHES = 50
+LATENCY_MATCHES = 10  # Batch-of-one latency is measured on the first few only
+
+def run_backend(name, model, token_lists):
+    eval_surprise.model = model
+    # Warm-up (graph optimization, thread pools, allocator)
+    evaluate_surprise_single_pass(token_lists[0][:256])
+
+    latencies = []
+    for tokens in token_lists[:LATENCY_MATCHES]:
+        start = time.perf_counter()
+        evaluate_surprise_single_pass(tokens)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    scores = evaluate_surprise_batched(token_lists, BATCH_TOKEN_BUDGET)
+    elapsed = time.perf_counter() - start
+
+    total_tokens = sum(len(tokens) for tokens in token_lists)
+    print(f"{name:>6} | latency p50 {np.median(latencies) * 1000:8.1f} ms | "
+          f"max {max(latencies) * 1000:8.1f} ms | batched {total_tokens / elapsed:10,.0f} tok/s")
+    return scores
+
+# Eager PyTorch vs exported ONNX graph on the same matches
+if __name__ == "__main__":
+    assert BACKEND == "torch", "Run the benchmark with the eager model loaded (unset LOL_BACKEND)"
+    assert eval_surprise.model.device.type == "cpu", "The ONNX backend runs on CPU; compare on a CPU host"
+    if not os.path.exists(onnx_path(MODEL_PATH)):
+        export_onnx(MODEL_PATH)
+
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    token_lists = [custom_split(eval_dataset[idx]["text"]) for idx in range(min(NUM_MATCHES, len(eval_dataset)))]
+    print(f"{len(token_lists)} matches, {sum(len(t) for t in token_lists)} tokens, {torch.get_num_threads()} torch threads\n")
+
+    torch_model = eval_surprise.model
+    torch_scores = run_backend("torch", torch_model, token_lists)
+    onnx_scores = run_backend("onnx", OnnxBackend(MODEL_PATH), token_lists)
+    eval_surprise.model = torch_model
+
+    diffs = [abs(a[role] - b[role]) for a, b in zip(torch_scores, onnx_scores) for role in ROLE_COLUMNS]
+    print(f"\nPer-role score difference (onnx vs torch): mean {np.mean(diffs):.6f} | max {max(diffs):.6f}")
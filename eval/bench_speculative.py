@@ -0,0 +1,55 @@
+import sys
+import time
+import torch
+from datasets import load_dataset
+
+from inference import load_model
+from sampling import generate_speculative
+
+sys.path.append("../data")
+from bracket_tokenizer import BracketTokenizer
+
+# Setup
+MODEL_PATH = "../model/lol-model-neox"
+DRAFT_MODEL_PATH = "../model/lol-model-neox-draft"
+TOKENIZER_PATH = "../model/my_tokenizer"
+EVAL_FILE = "../data/eval_tokens.txt"
+NUM_PROMPTS = 5
+PROMPT_TOKENS = 512  # Prompts are the opening of eval matches
+NEW_TOKENS = 512  # Fixed length per run, no early stop, so every setting does the same work
+DRAFT_SETTINGS = [0, 2, 4, 6, 8]  # 0 = plain sampling with the main model
+SEED = 0
+
+def run(model, draft_model, prompts, num_draft):
+    torch.manual_seed(SEED)
+    totals = {"rounds": 0, "drafted": 0, "accepted": 0, "tokens": 0}
+    start = time.perf_counter()
+    for prompt_ids in prompts:
+        generated, stats = generate_speculative(model, draft_model, prompt_ids, NEW_TOKENS, num_draft)
+        for key in stats:
+            totals[key] += stats[key]
+        totals["tokens"] += len(generated)
+    return totals, time.perf_counter() - start
+
+# Tokens/sec and acceptance rate of speculative decoding vs plain sampling
+if __name__ == "__main__":
+    tokenizer = BracketTokenizer.from_pretrained(TOKENIZER_PATH)
+    model = load_model(MODEL_PATH)
+    draft_model = load_model(DRAFT_MODEL_PATH, device=model.device)
+
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    prompts = [
+        tokenizer.encode(eval_dataset[idx]["text"])[:PROMPT_TOKENS]
+        for idx in range(min(NUM_PROMPTS, len(eval_dataset)))
+    ]
+    run(model, draft_model, prompts[:1], 2)  # Warm-up
+
+    print(f"{len(prompts)} prompts x {NEW_TOKENS} new tokens on {model.device}\n")
+    baseline = None
+    for num_draft in DRAFT_SETTINGS:
+        totals, elapsed = run(model, draft_model, prompts, num_draft)
+        tok_s = totals["tokens"] / elapsed
+        baseline = baseline or tok_s
+        acceptance = totals["accepted"] / totals["drafted"] if totals["drafted"] else float("nan")
+        print(f"draft {num_draft} | {tok_s:8.1f} tok/s (x{tok_s / baseline:.2f}) | "
+              f"acceptance {acceptance:6.1%} | {totals['tokens'] / totals['rounds']:.2f} tokens per main-model forward")
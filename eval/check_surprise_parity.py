@@ -0,0 +1,55 @@
+from datasets import load_dataset
+from tqdm import tqdm
+
+from eval_surprise import (
+    ROLE_TOKENS, custom_split,
+    evaluate_surprise, evaluate_surprise_single_pass, evaluate_surprise_batched,
+)
+from live_surprise import LiveSurpriseScorer, split_frames
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+NUM_MATCHES = 20
+MAX_TOKENS = 2048  # Per-prefix reference is quadratic, keep the sample short
+TOLERANCE = 1e-3   # Absolute, per role; only float accumulation order differs
+BATCH_TOKEN_BUDGET = 4096  # Small budget so the sample spans several padded batches
+
+def max_role_diff(reference, candidate):
+    return max(abs(reference.get(role, 0.0) - candidate.get(role, 0.0)) for role in ROLE_TOKENS)
+
+def live_scores(tokens):
+    scorer = LiveSurpriseScorer()
+    for chunk in split_frames(tokens):
+        scorer.feed(chunk)
+    scorer.finish()
+    return scorer.scores
+
+# Parity: single forward pass, padded batches and live KV-cache scoring vs per-prefix loop
+if __name__ == "__main__":
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+
+    sample = [
+        custom_split(eval_dataset[idx]["text"])[:MAX_TOKENS]
+        for idx in range(min(NUM_MATCHES, len(eval_dataset)))
+    ]
+    batched = evaluate_surprise_batched(sample, BATCH_TOKEN_BUDGET)
+
+    failures = []
+    worst = 0.0
+    for idx, tokens in enumerate(tqdm(sample, desc="Checking parity")):
+        reference = evaluate_surprise(tokens)
+        candidates = {
+            "single pass": evaluate_surprise_single_pass(tokens),
+            "batched": batched[idx],
+            "live": live_scores(tokens),
+        }
+        for mode, scores in candidates.items():
+            diff = max_role_diff(reference, scores)
+            worst = max(worst, diff)
+            if diff > TOLERANCE:
+                failures.append((idx, mode, diff))
+
+    for idx, mode, diff in failures:
+        print(f"Match {idx}: {mode} differs by {diff:.6f}")
+    assert not failures, f"{len(failures)} checks exceed tolerance {TOLERANCE}"
+    print(f"\n✅ Single-pass, batched and live scores match per-prefix scores (max diff {worst:.6f})")
@@ -59,22 +59,63 @@ def kda_from_tokens(line: str):
         out[r] = ratio
     return out
 
+class KdaCounter:
+    # Incremental kda_from_tokens: feed() bracket tokens one at a time (e.g. while a match is
+    # generated) and read kda() at any point. After the whole match it equals kda_from_tokens
+    # on the space-joined tokens.
+    def __init__(self):
+        self.K, self.D, self.A = defaultdict(int), defaultdict(int), defaultdict(int)
+        self._state = None  # None, "KILL" (collecting killer/victim), "KILLED" or "ASSIST"
+        self._pending = []
+
+    def feed(self, token):
+        if self._state == "KILL":
+            self._pending.append(token)
+            if len(self._pending) == 2:
+                killer, victim = (t.strip("[]") for t in self._pending)
+                self.K[killer] += 1
+                self.D[victim] += 1
+                self._state = "KILLED"
+            return
+        if self._state == "KILLED":
+            self._state = None
+            if token == "[ASSIST]":
+                self._state = "ASSIST"
+                return
+        elif self._state == "ASSIST":
+            if PLAYER_RE.fullmatch(token):
+                self.A[token.strip("[]")] += 1
+                return
+            self._state = None
+
+        if token == "[KILL]":
+            self._state = "KILL"
+            self._pending = []
+
+    def kda(self):
+        out = {}
+        for r in ROLES:
+            tag = r.strip("[]")
+            out[r] = round((self.K[tag] + self.A[tag]) / max(1, self.D[tag]), 2)
+        return out
+
 # Run on all matches and save to CSV
-match_rows = []
-
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    for idx, line in enumerate(f):
-        kda_scores = kda_from_tokens(line.strip())
-        row = {"Match ID": idx}
-        for role in ROLES:
-            row[role] = kda_scores[role]
-        match_rows.append(row)
-
-# Save to CSV
-fieldnames = ["Match ID"] + ROLES
-with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(match_rows)
-
-print(f"KDA summary saved to {OUTPUT_FILE} in compact format")
+if __name__ == "__main__":
+    match_rows = []
+
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        for idx, line in enumerate(f):
+            kda_scores = kda_from_tokens(line.strip())
+            row = {"Match ID": idx}
+            for role in ROLES:
+                row[role] = kda_scores[role]
+            match_rows.append(row)
+
+    # Save to CSV
+    fieldnames = ["Match ID"] + ROLES
+    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(match_rows)
+
+    print(f"KDA summary saved to {OUTPUT_FILE} in compact format")
@@ -0,0 +1,180 @@
+import re
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+# Decoding constraints for generated matches: stop at [GAME_END][TEAMx], and optionally
+# only allow token sequences that follow the event layout data/token_processor.py writes.
+
+PARTICIPANT_RE = re.compile(r"\[((TOP|JUNGLE|MIDDLE|BOTTOM|UTILITY)_[BR]|P(\d+|None))\]")
+NUMBER_RE = re.compile(r"\[\d+\]")
+TEAM_RE = re.compile(r"\[TEAM\d+\]")
+
+# Slot classes
+P, NUM, TEAM, ANY = "P", "NUM", "TEAM", "ANY"
+
+# Tails: what may follow once an event's fixed slots are filled
+TOP = "TOP"                      # Next event head, [FRAME] or [GAME_END]
+KILL = "KILL"                    # [ASSIST] or [BOUNTY]
+KILL_ASSISTS = "KILL_ASSISTS"    # More assisting participants or [BOUNTY]
+ASSIST_OPTIONAL = "ASSIST_OPTIONAL"
+ASSISTS = "ASSISTS"              # More assisting participants or the next event
+BUILDING = "BUILDING"            # Tower type or the killer
+OPEN = "OPEN"                    # Anything until the next event (ITEM_UNDO, after GAME_END)
+
+# Fixed slots and tail per event head, mirroring the process_* helpers
+HEAD_RULES = {
+    "[SKILL_UP]": ((P, ANY), TOP),
+    "[LEVEL_UP]": ((P, NUM), TOP),
+    "[ITEM_BUY]": ((P, ANY), TOP),
+    "[ITEM_SELL]": ((P, ANY), TOP),
+    "[ITEM_USE]": ((P, ANY), TOP),
+    "[ITEM_UNDO]": ((P,), OPEN),  # Empty slots are written as [[EMPTY]], which splits unevenly
+    "[WARD_PLACE]": ((P, ANY), TOP),
+    "[WARD_KILL]": ((P, ANY), TOP),
+    "[KILL]": ((P, P), KILL),
+    "[MONSTER_DRAGON]": ((ANY, P), ASSIST_OPTIONAL),
+    "[BUILDING_DESTROY]": ((ANY,), BUILDING),
+    "[BUILDING_PLATE]": ((ANY, P), TOP),
+    "[GAME_END]": ((TEAM,), OPEN),
+    "[FRAME]": ((), TOP),
+    # STATE_TOKENS block: a role, [GOLD_n], [XP_n], level and zone per participant until the
+    # next [FRAME]. In the last frame it follows [GAME_END][TEAMx], where generation stops.
+    "[FRAME_STATE]": ((), OPEN),
+}
+
+def head_rule(token):
+    if token in HEAD_RULES:
+        return HEAD_RULES[token]
+    if token.startswith("[SPECIAL_"):
+        return (P,), TOP
+    if token.startswith("[MONSTER_"):
+        return (P,), ASSIST_OPTIONAL
+    return None
+
+class EventGrammar:
+    # Finite-state view of the token layout. A state is (remaining slots, tail); transitions
+    # and allowed-token masks are per token id, and masks are cached per state.
+    START = ((), TOP)
+
+    def __init__(self, vocab):
+        size = max(vocab.values()) + 1
+        self.rules = {}
+        masks = {name: torch.zeros(size, dtype=torch.bool) for name in (P, NUM, TEAM, ANY, TOP, "ALL")}
+        self.kind = {}
+        for token, token_id in vocab.items():
+            rule = head_rule(token)
+            if token in ("[PAD]", "[UNK]"):
+                kind = "SKIP"
+            elif rule is not None:
+                kind = TOP
+                self.rules[token_id] = rule
+            elif token in ("[ASSIST]", "[BOUNTY]"):
+                kind = token
+            elif PARTICIPANT_RE.fullmatch(token):
+                kind = P
+            elif NUMBER_RE.fullmatch(token):
+                kind = NUM
+            elif TEAM_RE.fullmatch(token):
+                kind = TEAM
+            elif token.startswith("[RANK_") or token == "[GAME_START]":
+                kind = "START"
+            else:
+                kind = ANY
+            self.kind[token_id] = kind
+            if kind in masks:
+                masks[kind][token_id] = True
+            if kind != "SKIP":
+                masks["ALL"][token_id] = True
+
+        self.assist_id = vocab["[ASSIST]"]
+        self.bounty_id = vocab["[BOUNTY]"]
+        self.class_masks = masks
+        self._cache = {}
+
+    def step(self, state, token_id):
+        # Prompt tokens are consumed the same way, so a prompt that already deviates from the
+        # layout just moves on instead of failing
+        kind = self.kind.get(token_id, ANY)
+        if kind == "SKIP":
+            return state
+        slots, tail = state
+        if slots:
+            return slots[1:], tail
+        if kind == TOP:
+            return self.rules[token_id]
+        if tail in (KILL, KILL_ASSISTS):
+            if token_id == self.bounty_id:
+                return (NUM,), TOP
+            if token_id == self.assist_id:
+                return (P,), KILL_ASSISTS
+        elif tail in (ASSIST_OPTIONAL, ASSISTS):
+            if token_id == self.assist_id:
+                return (P,), ASSISTS
+        elif tail == BUILDING:
+            if kind == ANY:
+                return (P,), ASSIST_OPTIONAL
+            if kind == P:
+                return (), ASSIST_OPTIONAL
+        return state
+
+    def allowed(self, state):
+        if state not in self._cache:
+            self._cache[state] = self._allowed(state)
+        return self._cache[state]
+
+    def _allowed(self, state):
+        masks = self.class_masks
+        slots, tail = state
+        if slots:
+            return masks[slots[0]]
+        mask = torch.zeros_like(masks["ALL"])
+        if tail == OPEN:
+            return masks["ALL"]
+        if tail in (TOP, ASSIST_OPTIONAL, ASSISTS):
+            mask |= masks[TOP]
+        if tail in (ASSIST_OPTIONAL, KILL):
+            mask[self.assist_id] = True
+        if tail in (KILL, KILL_ASSISTS):
+            mask[self.bounty_id] = True
+        if tail in (KILL_ASSISTS, ASSISTS, BUILDING):
+            mask |= masks[P]
+        if tail == BUILDING:
+            mask |= masks[ANY]
+        return mask
+
+class EventGrammarLogitsProcessor(LogitsProcessor):
+    # Masks every token the event grammar does not allow next. Works with model.generate
+    # and sampling.generate_batch (which calls select_rows when finished rows leave the batch).
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.states = None
+        self.seen = 0
+
+    def __call__(self, input_ids, scores):
+        if self.states is None:
+            self.states = [self.grammar.START] * input_ids.shape[0]
+        for row, new_ids in enumerate(input_ids[:, self.seen:].tolist()):
+            state = self.states[row]
+            for token_id in new_ids:
+                state = self.grammar.step(state, token_id)
+            self.states[row] = state
+        self.seen = input_ids.shape[1]
+
+        allowed = torch.stack([self.grammar.allowed(state) for state in self.states]).to(scores.device)
+        return scores.masked_fill(~allowed[:, :scores.shape[-1]], float("-inf"))
+
+    def select_rows(self, rows):
+        self.states = [self.states[r] for r in rows]
+
+class GameEndStoppingCriteria(StoppingCriteria):
+    # Stops a sequence once [GAME_END] and the winning-team token after it are generated
+    def __init__(self, game_end_id, prompt_length):
+        self.game_end_id = game_end_id
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        if input_ids.shape[1] - 2 >= self.prompt_length:
+            done = input_ids[:, -2] == self.game_end_id
+        return done
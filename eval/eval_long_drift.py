@@ -0,0 +1,60 @@
+import pandas as pd
+from datasets import load_dataset
+from tqdm import tqdm
+
+from eval_surprise import (
+    ROLE_TOKENS, LONG_WINDOW, custom_split,
+    evaluate_surprise_single_pass, evaluate_surprise_long,
+)
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+OUTPUT_CSV = "long_match_drift.csv"
+NUM_MATCHES = 100
+# Windows smaller than the match, so the sliding-window path is exercised on matches
+# that full-context scoring can still handle
+DRIFT_SETTINGS = [(2048, 512), (2048, 1024), (4096, 1024), (4096, 2048)]
+
+# Drift of sliding-window scores from full-context scores
+if __name__ == "__main__":
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+
+    sample = []
+    for row in eval_dataset:
+        tokens = custom_split(row["text"])
+        if len(tokens) <= LONG_WINDOW:
+            sample.append(tokens)
+        if len(sample) == NUM_MATCHES:
+            break
+
+    references = [evaluate_surprise_single_pass(tokens) for tokens in tqdm(sample, desc="Full context")]
+
+    drift_rows = []
+    for window, overlap in DRIFT_SETTINGS:
+        for tokens, reference in zip(tqdm(sample, desc=f"Window {window} / overlap {overlap}"), references):
+            if len(tokens) <= window:
+                continue
+            windowed = evaluate_surprise_long(tokens, window=window, overlap=overlap)
+            for role in sorted(ROLE_TOKENS):
+                full = reference.get(role, 0.0)
+                drift = windowed.get(role, 0.0) - full
+                drift_rows.append({
+                    "Window": window, "Overlap": overlap, "Tokens": len(tokens), "Role": role,
+                    "Full": full, "Drift": drift, "Relative": abs(drift) / max(abs(full), 1e-8),
+                })
+
+    if not drift_rows:
+        raise SystemExit("No sampled match is longer than the drift windows")
+
+    df = pd.DataFrame(drift_rows)
+    df.to_csv(OUTPUT_CSV, float_format="%.4f", index=False)
+
+    summary = df.groupby(["Window", "Overlap"]).agg(
+        matches=("Tokens", lambda x: len(x) // len(ROLE_TOKENS)),
+        mean_abs_drift=("Drift", lambda x: x.abs().mean()),
+        max_abs_drift=("Drift", lambda x: x.abs().max()),
+        median_relative=("Relative", "median"),
+    )
+    print("\nSliding-window drift from full-context scores:")
+    print(summary.to_string())
+    print(f"\n✅ Saved per-role drift to {OUTPUT_CSV}")
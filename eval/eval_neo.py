@@ -2,19 +2,23 @@ import torch
 import torch.nn.functional as F
 from datasets import load_dataset
 import random
-from transformers import GPTNeoXForCausalLM, PreTrainedTokenizerFast
+import sys
 import matplotlib.pyplot as plt
 import numpy as np
+from inference import load_model
+
+sys.path.append("../data")
+from bracket_tokenizer import BracketTokenizer
 
 # Load dataset and model
 eval_dataset = load_dataset("text", data_files={"validation": "../data/eval_tokens.txt"})["validation"]
 
-model = GPTNeoXForCausalLM.from_pretrained("../model/lol-model-neox").cpu().eval()
-tokenizer = PreTrainedTokenizerFast.from_pretrained("../model/lol-model-neox")
+model = load_model("../model/lol-model-neox", device=torch.device("cpu"))  # LOL_QUANTIZE=int8 for quantized inference
+tokenizer = BracketTokenizer.from_pretrained("../model/lol-model-neox")
 assert tokenizer.vocab_size == model.config.vocab_size
 
 def extract_single_token_probs(text, model, tokenizer, token_str):
-    input_ids = tokenizer(text, return_tensors="pt", truncation=True, max_length=8192)["input_ids"].cpu()
+    input_ids = torch.tensor([tokenizer.encode(text, max_length=8192)])
     token_id = tokenizer.convert_tokens_to_ids(token_str)
     if token_id is None or token_id >= tokenizer.vocab_size:
         raise ValueError(f"{token_str} not found in vocab.")
@@ -40,7 +44,7 @@ def plot_event_prob_trends(event_probs, name):
 
 # Example match 
 sample_text = random.choice(eval_dataset)["text"]
-input_ids = tokenizer(sample_text, return_tensors="pt")["input_ids"]
+input_ids = torch.tensor([tokenizer.encode(sample_text)])
 
 vocab_size = tokenizer.vocab_size
 if torch.any(input_ids >= vocab_size):
@@ -0,0 +1,125 @@
+import os
+import glob
+import json
+import multiprocessing as mp
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datasets import load_dataset
+from inference import QUANTIZE, BACKEND
+
+# Setup
+MODEL_PATH = "../model/lol-model-neox"  # As in eval_surprise.py
+EVAL_FILE = "../data/eval_tokens.txt"
+OUTPUT_CSV = "match_surprise.csv"
+SHARD_DIR = "surprise_shards"
+MANIFEST_FILE = "manifest.json"  # What the shards in SHARD_DIR were computed from
+NUM_WORKERS = 8
+NUM_SHARDS = 64  # More shards than workers, so a crash only loses a small slice of work
+THREADS_PER_WORKER = max(1, (os.cpu_count() or 1) // NUM_WORKERS)
+
+def shard_path(start, end):
+    # Named by the match range, so a shard file never stands for other rows
+    return os.path.join(SHARD_DIR, f"shard_{start:07d}_{end:07d}.csv")
+
+def run_manifest(num_matches):
+    # Everything the shard rows depend on: input file, model checkpoint and settings, sharding
+    model_files = [os.path.join(MODEL_PATH, name) for name in os.listdir(MODEL_PATH)]
+    return {
+        "eval_file": os.path.abspath(EVAL_FILE),
+        "eval_file_mtime": os.path.getmtime(EVAL_FILE),
+        "eval_file_size": os.path.getsize(EVAL_FILE),
+        "num_matches": num_matches,
+        "model_path": os.path.abspath(MODEL_PATH),
+        "model_mtime": max(os.path.getmtime(path) for path in model_files if os.path.isfile(path)),
+        "quantize": QUANTIZE,
+        "backend": BACKEND,
+        "num_shards": NUM_SHARDS,
+    }
+
+def check_manifest(manifest):
+    # Shards of an earlier run are kept only if it had the same manifest; otherwise they are deleted
+    path = os.path.join(SHARD_DIR, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if json.load(f) == manifest:
+                return
+        print("Input, model or NUM_SHARDS changed since the last run, discarding its shards")
+    for stale in glob.glob(os.path.join(SHARD_DIR, "shard_*.csv*")):
+        os.remove(stale)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def shard_ranges(num_matches, num_shards):
+    # Contiguous [start, end) ranges, so merging shards in order restores input order
+    bounds = [num_matches * k // num_shards for k in range(num_shards + 1)]
+    return [(k, bounds[k], bounds[k + 1]) for k in range(num_shards) if bounds[k] < bounds[k + 1]]
+
+def init_worker(slots):
+    # Runs once per worker process: pin threads (and cores on Linux) before torch starts
+    # its thread pools, then load the model a single time by importing eval_surprise. Each
+    # worker holds its own copy of the weights, so memory grows with NUM_WORKERS.
+    slot = slots.get()
+    os.environ["OMP_NUM_THREADS"] = str(THREADS_PER_WORKER)
+    if hasattr(os, "sched_setaffinity"):
+        cores = range(slot * THREADS_PER_WORKER, (slot + 1) * THREADS_PER_WORKER)
+        os.sched_setaffinity(0, {c for c in cores if c < os.cpu_count()} or {0})
+
+    import torch
+    torch.set_num_threads(THREADS_PER_WORKER)
+    import eval_surprise  # noqa: F401
+
+def score_shard(shard_idx, start, end):
+    from eval_surprise import BATCH_TOKEN_BUDGET, ROLE_TOKENS, custom_split, evaluate_surprise_batched
+
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    all_tokens = [custom_split(eval_dataset[idx]["text"]) for idx in range(start, end)]
+    all_scores = evaluate_surprise_batched(all_tokens, BATCH_TOKEN_BUDGET)
+
+    match_rows = []
+    for idx, role_scores in zip(range(start, end), all_scores):
+        match_result = {"Match ID": idx}
+        for role in sorted(ROLE_TOKENS):
+            match_result[role] = role_scores.get(role, 0.0)
+        match_rows.append(match_result)
+
+    # Write-then-rename: a shard file only exists once it is complete
+    tmp_path = shard_path(start, end) + ".tmp"
+    pd.DataFrame(match_rows).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, shard_path(start, end))
+    return shard_idx
+
+# === Run Sharded Evaluation ===
+if __name__ == "__main__":
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    shards = shard_ranges(len(eval_dataset), NUM_SHARDS)
+
+    # Resume: shards from an earlier (crashed) run of the same input and model are kept
+    check_manifest(run_manifest(len(eval_dataset)))
+    pending = [shard for shard in shards if not os.path.exists(shard_path(shard[1], shard[2]))]
+    print(f"{len(shards) - len(pending)}/{len(shards)} shards already done, "
+          f"{NUM_WORKERS} workers x {THREADS_PER_WORKER} threads")
+
+    ctx = mp.get_context("spawn")
+    slots = ctx.Queue()
+    for slot in range(NUM_WORKERS):
+        slots.put(slot)
+
+    failed = []
+    with ProcessPoolExecutor(NUM_WORKERS, mp_context=ctx, initializer=init_worker, initargs=(slots,)) as pool:
+        futures = {pool.submit(score_shard, *shard): shard[0] for shard in pending}
+        for future in as_completed(futures):
+            try:
+                print(f"Shard {future.result()} done")
+            except Exception as e:
+                print(f"[Shard {futures[future]} failed] {e}")
+                failed.append(futures[future])
+
+    if failed:
+        raise SystemExit(f"{len(failed)} shards failed; rerun to resume them: {sorted(failed)}")
+
+    # Deterministic merge: shard order is input order
+    df = pd.concat([pd.read_csv(shard_path(start, end)) for _, start, end in shards], ignore_index=True)
+    df.to_csv(OUTPUT_CSV, float_format="%.2f", index=False)
+    print(f"\n✅ Saved all surprise scores to {OUTPUT_CSV}")
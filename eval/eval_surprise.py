@@ -2,22 +2,32 @@ import torch
 import torch.nn.functional as F
 import math
 import re
+import sys
 import pandas as pd
 from datasets import load_dataset
 from tqdm import tqdm
 from collections import defaultdict
-from transformers import GPTNeoXForCausalLM, PreTrainedTokenizerFast
+from inference import load_model
+
+sys.path.append("../data")
+from token_ids import load_token_ids, match_ids
+from bracket_tokenizer import BracketTokenizer
 
 # Setup
 MODEL_PATH = "../model/lol-model-neox"
 TOKENIZER_PATH = "../model/my_tokenizer"
 TOKENS_FILE = "../data/cd_tokens.txt"
 OUTPUT_CSV = "match_surprise.csv"
+# Score the eval split from token_processor.py's token ids (train_neo.py with USE_TOKEN_IDS
+# writes eval_index.npy) instead of re-splitting eval_tokens.txt
+USE_TOKEN_IDS = False
+TOKEN_IDS_FILE = "../data/processed_tokens.bin"
+EVAL_INDEX_FILE = "../data/eval_index.npy"
 
 # Load model and tokenizer
-hf_tokenizer = PreTrainedTokenizerFast.from_pretrained(TOKENIZER_PATH)
-model = GPTNeoXForCausalLM.from_pretrained(MODEL_PATH).to(torch.device("cuda" if torch.cuda.is_available() else "cpu")).eval()
-assert hf_tokenizer.vocab_size == model.config.vocab_size
+tokenizer = BracketTokenizer.from_pretrained(TOKENIZER_PATH)  # my_tokenizer's ids without transformers
+model = load_model(MODEL_PATH)  # LOL_QUANTIZE=int8 for quantized CPU inference
+assert tokenizer.vocab_size == model.config.vocab_size
 
 # Tokenization helper
 def custom_split(text):
@@ -28,7 +38,7 @@ ROLE_TOKENS = {
     "[TOP_B]", "[JUNGLE_B]", "[MIDDLE_B]", "[BOTTOM_B]", "[UTILITY_B]",
     "[TOP_R]", "[JUNGLE_R]", "[MIDDLE_R]", "[BOTTOM_R]", "[UTILITY_R]"
 }
-ROLE_TOKEN_IDS = [hf_tokenizer.convert_tokens_to_ids(r) for r in ROLE_TOKENS]
+ROLE_TOKEN_IDS = [tokenizer.convert_tokens_to_ids(r) for r in ROLE_TOKENS]
 
 SURPRISE_EVENT_HEADS = {
     "[KILL]", "[ASSIST]",
@@ -68,12 +78,15 @@ def compute_role_surprise(logits, token_id):
     prob = role_probs[index].item()
     return -math.log2(prob + 1e-8)
 
+def is_event_boundary(t):
+    return t.startswith("[") and (t in SURPRISE_EVENT_HEADS or t.startswith("[FRAME") or t.startswith("[GAME_"))
+
 def parse_event_roles(tokens, start_idx):
     roles = []
     i = start_idx + 1
     while i < len(tokens):
         t = tokens[i]
-        if t.startswith("[") and (t in SURPRISE_EVENT_HEADS or t.startswith("[FRAME") or t.startswith("[GAME_")):
+        if is_event_boundary(t):
             break
         if t in ROLE_TOKENS:
             roles.append((i, t))
@@ -98,7 +111,7 @@ def assign_surprise_by_event(event, event_surprise, role_surprises, roles, score
             scores[role] += total_surprise(idx)
 
 def evaluate_surprise(tokens):
-    input_ids = hf_tokenizer.convert_tokens_to_ids(tokens)
+    input_ids = tokenizer.convert_tokens_to_ids(tokens)
     scores = defaultdict(float)
 
     for i in range(1, len(tokens)):
@@ -124,9 +137,249 @@ def evaluate_surprise(tokens):
 
     return scores
 
+# Vectorized scoring: per-token-id lookup tables, so event heads, roles and event
+# boundaries are found with tensor ops instead of Python string checks
+ROLE_COLUMNS = sorted(ROLE_TOKENS)  # Column order of [matches x 10 roles] score tensors
+ROLE_COLUMN_IDS = torch.tensor([tokenizer.convert_tokens_to_ids(r) for r in ROLE_COLUMNS], device=model.device)
+
+def build_id_tables():
+    vocab = tokenizer.get_vocab()
+    is_head = torch.zeros(tokenizer.vocab_size, dtype=torch.bool)
+    is_boundary = torch.zeros(tokenizer.vocab_size, dtype=torch.bool)
+    weights = torch.zeros(tokenizer.vocab_size, dtype=torch.float64)
+    role_column = torch.full((tokenizer.vocab_size,), -1, dtype=torch.long)
+    for token, token_id in vocab.items():
+        is_head[token_id] = token in SURPRISE_EVENT_HEADS
+        is_boundary[token_id] = is_event_boundary(token)
+        weights[token_id] = EVENT_WEIGHTS.get(token, 1.0)
+    for column, role in enumerate(ROLE_COLUMNS):
+        role_column[vocab[role]] = column
+    return is_head.to(model.device), is_boundary.to(model.device), weights.to(model.device), role_column.to(model.device)
+
+IS_HEAD_ID, IS_BOUNDARY_ID, EVENT_WEIGHT_BY_ID, ROLE_COLUMN_BY_ID = build_id_tables()
+KILL_ID = tokenizer.convert_tokens_to_ids("[KILL]")
+ASSIST_ID = tokenizer.convert_tokens_to_ids("[ASSIST]")
+
+def event_role_index(input_ids):
+    # input_ids: [batch, seq_len]. Returns, for every role token that belongs to a scored event:
+    # its batch row, position, owning event-head position, role column, and the sign/share
+    # assign_surprise_by_event applies to it.
+    batch_size, seq_len = input_ids.shape
+    positions = torch.arange(seq_len, device=input_ids.device).expand(batch_size, seq_len)
+
+    columns = ROLE_COLUMN_BY_ID[input_ids]
+    is_role = columns >= 0
+    # Position of the latest boundary at or before each token (-1 if none yet)
+    last_boundary = torch.where(
+        IS_BOUNDARY_ID[input_ids], positions, torch.full_like(positions, -1)
+    ).cummax(dim=1).values
+
+    # Heads at position 0 are never scored (same as evaluate_surprise)
+    rows, role_pos = torch.nonzero(is_role & (last_boundary >= 1), as_tuple=True)
+    owner = last_boundary[rows, role_pos]
+    keep = IS_HEAD_ID[input_ids[rows, owner]]
+    rows, role_pos, owner = rows[keep], role_pos[keep], owner[keep]
+
+    # Index of each role inside its event and number of roles in the event
+    role_count = is_role.long().cumsum(dim=1)
+    ordinal = role_count[rows, role_pos] - role_count[rows, owner] - 1
+    flat_owner = rows * seq_len + owner
+    roles_in_event = torch.zeros(batch_size * seq_len, dtype=torch.long, device=input_ids.device)
+    roles_in_event.index_add_(0, flat_owner, torch.ones_like(flat_owner))
+    roles_in_event = roles_in_event[flat_owner]
+
+    # [KILL] with >= 2 roles: killer +, victim -, anyone else ignored; [ASSIST]: half share
+    head_ids = input_ids[rows, owner]
+    multiplier = torch.ones(len(rows), dtype=torch.float64, device=input_ids.device)
+    kill = (head_ids == KILL_ID) & (roles_in_event >= 2)
+    multiplier[kill & (ordinal == 1)] = -1.0
+    multiplier[kill & (ordinal >= 2)] = 0.0
+    multiplier[head_ids == ASSIST_ID] = 0.5
+
+    return rows, role_pos, owner, columns[rows, role_pos], multiplier
+
+def surprise_bits(log_probs):
+    # -log2(p + 1e-8) as in compute_event_surprise, in float64 like the .item() path
+    return -torch.log2(log_probs.double().exp() + 1e-8)
+
+def position_log_probs(input_ids, logits):
+    # For every position i >= 1 of input_ids [batch, seq_len]: the full-vocab log-prob of the
+    # actual token, and its log-prob restricted to the 10 role ids (only meaningful where the
+    # token is a role). logits[:, i - 1] is the next-token distribution for position i;
+    # position 0 has no prediction and stays 0. These two arrays are all scoring needs.
+    log_probs = torch.zeros(input_ids.shape, device=input_ids.device)
+    role_log_probs = torch.zeros(input_ids.shape, device=input_ids.device)
+    if input_ids.shape[1] < 2:
+        return log_probs, role_log_probs
+
+    next_ids = input_ids[:, 1:].unsqueeze(-1)
+    log_probs[:, 1:] = F.log_softmax(logits[:, :-1], dim=-1).gather(2, next_ids).squeeze(-1)
+    next_columns = ROLE_COLUMN_BY_ID[input_ids[:, 1:]].clamp(min=0).unsqueeze(-1)
+    role_log_probs[:, 1:] = F.log_softmax(logits[:, :-1, ROLE_COLUMN_IDS], dim=-1).gather(2, next_columns).squeeze(-1)
+    return log_probs, role_log_probs
+
+def role_contributions(input_ids, log_probs, role_log_probs):
+    # Weighted surprise of every scored role token, from position_log_probs output.
+    # Roles that get no share (a third role after a [KILL]) are dropped.
+    rows, role_pos, owner, columns, multiplier = event_role_index(input_ids)
+    scored = multiplier != 0
+    rows, role_pos, owner, columns, multiplier = (
+        rows[scored], role_pos[scored], owner[scored], columns[scored], multiplier[scored]
+    )
+    weight = EVENT_WEIGHT_BY_ID[input_ids[rows, owner]]
+    contribution = multiplier * weight * (
+        EVENT_ROLE_RATIO * surprise_bits(log_probs[rows, owner])
+        + (1 - EVENT_ROLE_RATIO) * surprise_bits(role_log_probs[rows, role_pos])
+    )
+    return rows, owner, columns, contribution
+
+def contribution_score_matrix(num_matches, rows, columns, contribution):
+    # role_contributions summed into [matches x 10 roles] scores, columns in ROLE_COLUMNS order
+    scores = torch.zeros(num_matches * len(ROLE_COLUMNS), dtype=torch.float64, device=contribution.device)
+    scores.index_add_(0, rows * len(ROLE_COLUMNS) + columns, contribution)
+    return scores.view(num_matches, len(ROLE_COLUMNS))
+
+def role_score_matrix(input_ids, log_probs, role_log_probs):
+    # [matches x 10 roles] scores, columns in ROLE_COLUMNS order
+    rows, _, columns, contribution = role_contributions(input_ids, log_probs, role_log_probs)
+    return contribution_score_matrix(input_ids.shape[0], rows, columns, contribution)
+
+def score_row_to_dict(row):
+    return dict(zip(ROLE_COLUMNS, row.tolist()))
+
+def score_from_logits(tokens, input_ids, logits):
+    # Role scores for one match given its full-sequence logits [seq_len, vocab]
+    input_tensor = torch.tensor([input_ids], device=logits.device)
+    log_probs, role_log_probs = position_log_probs(input_tensor, logits.unsqueeze(0))
+    return score_row_to_dict(role_score_matrix(input_tensor, log_probs, role_log_probs)[0])
+
+def evaluate_surprise_single_pass(tokens):
+    # Same scores as evaluate_surprise, but from one causal forward over the whole match.
+    input_ids = tokenizer.convert_tokens_to_ids(tokens)
+
+    input_tensor = torch.tensor([input_ids], device=model.device)
+    with torch.no_grad():
+        logits = model(input_tensor).logits[0]
+
+    return score_from_logits(tokens, input_ids, logits)
+
+def evaluate_surprise_events(tokens):
+    # Role scores plus per-event records {role: [(token index, event, score)]}, all from the
+    # same forward pass (sliding windows if the match exceeds the model's context)
+    input_ids = tokenizer.convert_tokens_to_ids(tokens)
+    input_tensor = torch.tensor([input_ids], device=model.device)
+    logits = sliding_window_logits(input_ids, LONG_WINDOW, LONG_OVERLAP)
+    log_probs, role_log_probs = position_log_probs(input_tensor, logits.unsqueeze(0))
+
+    rows, owner, columns, contribution = role_contributions(input_tensor, log_probs, role_log_probs)
+    event_logs = defaultdict(list)
+    for idx, column, score in zip(owner.tolist(), columns.tolist(), contribution.tolist()):
+        event_logs[ROLE_COLUMNS[column]].append((idx, tokens[idx], score))
+
+    scores = score_row_to_dict(contribution_score_matrix(1, rows, columns, contribution)[0])
+    return scores, event_logs
+
+def sliding_window_logits(input_ids, window, overlap):
+    # Next-token logits for every position of an arbitrarily long match. Windows of `window`
+    # tokens advance by window - overlap, and each one only contributes the rows after its
+    # first `overlap` tokens, so every position past the first window sees >= overlap tokens
+    # of context and positions never exceed what the model was trained on.
+    assert 0 <= overlap < window
+    stride = window - overlap
+    rows = []
+    start = 0
+    while True:
+        end = min(start + window, len(input_ids))
+        input_tensor = torch.tensor([input_ids[start:end]], device=model.device)
+        with torch.no_grad():
+            logits = model(input_tensor).logits[0]
+        rows.append(logits if start == 0 else logits[overlap:])
+        if end == len(input_ids):
+            break
+        start += stride
+    return torch.cat(rows)
+
+def evaluate_surprise_long(tokens, window=None, overlap=None):
+    # Scores every event head of a match of any length; identical to
+    # evaluate_surprise_single_pass when the match fits in one window.
+    window = window or LONG_WINDOW
+    overlap = LONG_OVERLAP if overlap is None else overlap
+    input_ids = tokenizer.convert_tokens_to_ids(tokens)
+    logits = sliding_window_logits(input_ids, window, overlap)
+    return score_from_logits(tokens, input_ids, logits)
+
+def bucket_by_length(lengths, token_budget):
+    # Groups indices of similar length so that batch_size * longest_length <= token_budget.
+    # A single match longer than the budget still gets a batch of its own.
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, batch = [], []
+    for i in order:
+        # Ascending order, so the match being added is the longest in its batch
+        if batch and lengths[i] * (len(batch) + 1) > token_budget:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def batched_log_probs(id_lists, token_budget):
+    # Runs the model over many matches and yields (match indices, input_ids, log_probs,
+    # role_log_probs) per batch, as [batch, seq_len] tensors. Batches are right-padded:
+    # padding sits after every real token, so the causal mask keeps each match's logits
+    # equal to its unbatched forward, and the attention mask keeps pad keys out of the
+    # softmax. Matches longer than the model's context come alone, via sliding windows.
+    fits = [i for i, ids in enumerate(id_lists) if len(ids) <= LONG_WINDOW]
+    for i in [i for i, ids in enumerate(id_lists) if len(ids) > LONG_WINDOW]:
+        input_tensor = torch.tensor([id_lists[i]], device=model.device)
+        logits = sliding_window_logits(id_lists[i], LONG_WINDOW, LONG_OVERLAP)
+        yield ([i], input_tensor) + position_log_probs(input_tensor, logits.unsqueeze(0))
+
+    for batch in bucket_by_length([len(id_lists[i]) for i in fits], token_budget):
+        batch = [fits[j] for j in batch]
+        max_len = max(len(id_lists[i]) for i in batch)
+        input_tensor = torch.full((len(batch), max_len), tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), max_len), dtype=torch.long)
+        for row, i in enumerate(batch):
+            input_tensor[row, :len(id_lists[i])] = torch.tensor(id_lists[i])
+            attention_mask[row, :len(id_lists[i])] = 1
+        input_tensor = input_tensor.to(model.device)
+
+        with torch.no_grad():
+            logits = model(input_tensor, attention_mask=attention_mask.to(model.device)).logits
+
+        yield (batch, input_tensor) + position_log_probs(input_tensor, logits)
+
+def evaluate_surprise_batched(token_lists, token_budget):
+    # Scores many matches, batching those of similar length; results in token_lists order
+    id_lists = [tokenizer.convert_tokens_to_ids(tokens) for tokens in token_lists]
+    return evaluate_surprise_batched_ids(id_lists, token_budget)
+
+def evaluate_surprise_batched_ids(id_lists, token_budget):
+    # evaluate_surprise_batched on token ids (lists or arrays)
+    id_lists = [list(map(int, ids)) for ids in id_lists]
+    results = [None] * len(id_lists)
+
+    progress = tqdm(total=len(id_lists), desc="Evaluating matches")
+    for batch, input_tensor, log_probs, role_log_probs in batched_log_probs(id_lists, token_budget):
+        batch_scores = role_score_matrix(input_tensor, log_probs, role_log_probs).cpu()
+        for row, i in enumerate(batch):
+            results[i] = score_row_to_dict(batch_scores[row])
+        progress.update(len(batch))
+    progress.close()
+
+    return results
+
+# Scoring mode: one forward pass per match (False falls back to the per-prefix loop)
+SINGLE_PASS = True
+# Max padded tokens per batched forward (0 scores one match at a time)
+BATCH_TOKEN_BUDGET = 32768
+# Sliding-window scoring for matches longer than the trained context
+LONG_WINDOW = model.config.max_position_embeddings
+LONG_OVERLAP = 2048
+
 # === Run Batch Evaluation ===
 if __name__ == "__main__":
-    eval_dataset = load_dataset("text", data_files={"validation": "../data/eval_tokens.txt"})["validation"]
     # with open(TOKENS_FILE, "r", encoding="utf-8") as f:
     #     eval_dataset = [custom_split(line.strip()) for line in f]
 
@@ -138,9 +391,25 @@ if __name__ == "__main__":
     #         match_result[role] = role_scores.get(role, 0.0)
     #     match_rows.append(match_result)
 
-    for idx, row in enumerate(tqdm(eval_dataset, desc="Evaluating matches")):
-        tokens = custom_split(row["text"])
-        role_scores = evaluate_surprise(tokens)
+    if USE_TOKEN_IDS:
+        token_ids, eval_index = load_token_ids(TOKEN_IDS_FILE, EVAL_INDEX_FILE)
+        all_ids = [match_ids(token_ids, entry) for entry in eval_index]
+    else:
+        eval_dataset = load_dataset("text", data_files={"validation": "../data/eval_tokens.txt"})["validation"]
+        all_tokens = [custom_split(row["text"]) for row in eval_dataset]
+
+    if SINGLE_PASS and BATCH_TOKEN_BUDGET:
+        if USE_TOKEN_IDS:
+            all_scores = evaluate_surprise_batched_ids(all_ids, BATCH_TOKEN_BUDGET)
+        else:
+            all_scores = evaluate_surprise_batched(all_tokens, BATCH_TOKEN_BUDGET)
+    else:
+        if USE_TOKEN_IDS:
+            all_tokens = [tokenizer.convert_ids_to_tokens(list(map(int, ids))) for ids in all_ids]
+        score_match = evaluate_surprise_long if SINGLE_PASS else evaluate_surprise
+        all_scores = [score_match(tokens) for tokens in tqdm(all_tokens, desc="Evaluating matches")]
+
+    for idx, role_scores in enumerate(all_scores):
         match_result = {"Match ID": idx}
         for role in sorted(ROLE_TOKENS):
             match_result[role] = role_scores.get(role, 0.0)
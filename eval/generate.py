@@ -1,11 +1,25 @@
+import csv
+import json
+import os
 import torch
-from transformers import GPTNeoXForCausalLM, PreTrainedTokenizerFast
+from transformers import PreTrainedTokenizerFast, LogitsProcessorList, StoppingCriteriaList
 import re
+import sys
+from inference import load_model
+from sampling import PrefixCache, generate_batch, generate_from_prefix, generate_speculative, generate_uncached
+from decoding import EventGrammar, EventGrammarLogitsProcessor, GameEndStoppingCriteria
+from compute_kda import ROLES, KdaCounter
+
+sys.path.append("../data")
+from bracket_tokenizer import BracketTokenizer
 
 # Paths
 MODEL_PATH = "../model/lol-model-neox"
+DRAFT_MODEL_PATH = "../model/lol-model-neox-draft"  # train_neo.py with MODEL_SIZE = "draft"
 TOKENIZER_PATH = "../model/my_tokenizer"
 OUTPUT_FILE = "generated_matches.txt"
+SCORES_FILE = "generated_scores.jsonl"
+KDA_FILE = "generated_kda.csv"
 
 # Prompts
 PROMPTS = [
@@ -16,48 +30,180 @@ PROMPTS = [
 # Device
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# Samples per prompt. With one sample, prompts are generated together in padded batches;
+# with more, every prompt is encoded once and its KV cache is forked for its samples.
+NUM_SAMPLES = 1
+BATCH_SIZE = 64  # Sequences per batch (bounds KV cache memory)
+MAX_CACHED_PREFIXES = 8  # Encoded prompts kept for reuse (least recently used dropped first)
+MAX_NEW_TOKENS = 4000  # Upper bound; samples stop at [GAME_END][TEAMx]
+# Only sample tokens that fit the event layout of token_processor.py
+# (two roles after [KILL], a number after [BOUNTY], ...)
+GRAMMAR_CONSTRAINED = False
+# Also record each generated token's log-probs (the surprise inputs, as in
+# eval_surprise.position_log_probs) to SCORES_FILE, and count KDA while sampling into KDA_FILE
+SCORE_WHILE_GENERATING = False
+# Speculative decoding: the draft model proposes NUM_DRAFT_TOKENS tokens per step and the
+# main model checks them in one forward. Same output distribution; one sequence at a time,
+# without the grammar constraint or scoring.
+SPECULATIVE = False
+NUM_DRAFT_TOKENS = 4
+
 # Load tokenizer and model
-tokenizer = PreTrainedTokenizerFast.from_pretrained(TOKENIZER_PATH)
-model = GPTNeoXForCausalLM.from_pretrained(MODEL_PATH).to(DEVICE).eval()
+tokenizer = PreTrainedTokenizerFast.from_pretrained(TOKENIZER_PATH)  # Decoding and special token ids
+bracket_tokenizer = BracketTokenizer.from_pretrained(TOKENIZER_PATH)  # Encoding, same ids
+model = load_model(MODEL_PATH, device=DEVICE)  # LOL_QUANTIZE=int8 for quantized CPU inference
+draft_model = load_model(DRAFT_MODEL_PATH, device=DEVICE) if SPECULATIVE else None
+
+GAME_END_ID = tokenizer.convert_tokens_to_ids("[GAME_END]")
+grammar = EventGrammar(tokenizer.get_vocab()) if GRAMMAR_CONSTRAINED else None
+prefix_cache = PrefixCache(model, MAX_CACHED_PREFIXES)
+
+def make_logits_processor():
+    return EventGrammarLogitsProcessor(grammar) if grammar is not None else None
+
+ROLE_IDS = torch.tensor(tokenizer.convert_tokens_to_ids(ROLES), device=model.device)
+ROLE_COLUMN_BY_ID = torch.zeros(model.config.vocab_size, dtype=torch.long, device=model.device)
+ROLE_COLUMN_BY_ID[ROLE_IDS] = torch.arange(len(ROLES), device=model.device)
+SKIPPED_TOKENS = {"[PAD]", "[UNK]"}
+
+def surprise_inputs(logits, next_ids):
+    # Log-prob of each sampled token, and its log-prob among the 10 role tokens (only
+    # meaningful when it is a role), from the model's unprocessed next-token distribution
+    log_prob = logits.log_softmax(dim=-1).gather(-1, next_ids.unsqueeze(-1))
+    role_log_prob = logits[:, ROLE_IDS].log_softmax(dim=-1).gather(-1, ROLE_COLUMN_BY_ID[next_ids].unsqueeze(-1))
+    return torch.cat([log_prob, role_log_prob], dim=-1)
 
 # Helper: token splitting
 def custom_split(text):
     return [tok for tok in re.split(r"(\[[^\[\]]+?\])|\s+", text) if tok and tok.strip()]
 
+def encode_prompt(prompt):
+    return bracket_tokenizer.encode("[BOS] " + prompt)
+
+def decode_tokens(generated_ids):
+    generated_text = tokenizer.decode(generated_ids, skip_special_tokens=False)
+    return [tok for tok in custom_split(generated_text) if tok not in ("[PAD]", "[UNK]")]
+
 # Generation function
-def generate(prompt, max_new_tokens=4000):
-    full_prompt = "[BOS] " + prompt
-    input_ids = tokenizer(full_prompt, return_tensors="pt").input_ids.to(DEVICE)
+def generate_ids(prompt, max_new_tokens=MAX_NEW_TOKENS):
+    input_ids = torch.tensor([encode_prompt(prompt)], device=model.device)
+
+    if not hasattr(model, "generate"):
+        output = generate_uncached(model, input_ids, max_new_tokens, eos_token_id=tokenizer.eos_token_id,
+                                   stop_after_id=GAME_END_ID, logits_processor=make_logits_processor())
+    else:
+        processor = make_logits_processor()
+        with torch.no_grad():
+            output = model.generate(
+                input_ids,
+                max_new_tokens=max_new_tokens,
+                do_sample=True,
+                top_p=0.9,
+                temperature=1.0,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([GameEndStoppingCriteria(GAME_END_ID, input_ids.shape[1])]),
+                logits_processor=LogitsProcessorList([processor] if processor is not None else []),
+            )
+
+    return output[0][input_ids.shape[1]:].tolist()
 
-    with torch.no_grad():
-        output = model.generate(
-            input_ids,
+def generate(prompt, max_new_tokens=MAX_NEW_TOKENS):
+    return decode_tokens(generate_ids(prompt, max_new_tokens))
+
+# Batched generation: every prompt x num_samples, at most batch_size sequences per batch.
+# Yields ((prompt index, sample index), generated ids, per-token surprise inputs or None,
+# KdaCounter or None) as each sample finishes.
+def generate_all(prompts, num_samples=NUM_SAMPLES, max_new_tokens=MAX_NEW_TOKENS, batch_size=BATCH_SIZE,
+                 score=SCORE_WHILE_GENERATING):
+    prompt_ids = [encode_prompt(prompt) for prompt in prompts]
+    rows = [(p, s) for p in range(len(prompts)) for s in range(num_samples)]
+
+    if num_samples == 1:
+        # Distinct prompts: one left-padded batch, nothing to share
+        batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+    else:
+        # Samples of one prompt start from its cached KV state instead of re-encoding it
+        batches = [
+            [(p, s) for s in range(start, min(start + batch_size, num_samples))]
+            for p in range(len(prompts)) for start in range(0, num_samples, batch_size)
+        ]
+
+    for batch_rows in batches:
+        counters = [KdaCounter() for _ in batch_rows] if score else None
+
+        def count_token(row, token_id):
+            token = tokenizer.convert_ids_to_tokens(token_id)
+            if token not in SKIPPED_TOKENS:
+                counters[row].feed(token)
+
+        decode_kwargs = dict(
             max_new_tokens=max_new_tokens,
-            do_sample=True,
-            top_p=0.9,
-            temperature=1.0,
-            pad_token_id=tokenizer.pad_token_id,
-            eos_token_id=tokenizer.eos_token_id
+            eos_token_id=tokenizer.eos_token_id,
+            stop_after_id=GAME_END_ID,
+            logits_processor=make_logits_processor(),
+            score_fn=surprise_inputs if score else None,
+            on_token=count_token if score else None,
         )
+        if num_samples == 1:
+            finished = generate_batch(model, [prompt_ids[p] for p, _ in batch_rows],
+                                      pad_token_id=tokenizer.pad_token_id, **decode_kwargs)
+        else:
+            finished = generate_from_prefix(model, prefix_cache, prompt_ids[batch_rows[0][0]],
+                                            len(batch_rows), **decode_kwargs)
 
-    generated_ids = output[0][input_ids.shape[1]:]
-    generated_text = tokenizer.decode(generated_ids, skip_special_tokens=False)
-    tokens = [tok for tok in custom_split(generated_text) if tok not in ("[PAD]", "[UNK]")]
-    return tokens
+        for row, generated_ids, *token_scores in finished:
+            if score:
+                yield batch_rows[row], generated_ids, token_scores[0], counters[row]
+            else:
+                yield batch_rows[row], generated_ids, None, None
+
+# Run, writing each sample as soon as it finishes
+if SPECULATIVE:
+    assert not GRAMMAR_CONSTRAINED and not SCORE_WHILE_GENERATING, "Not supported with speculative decoding"
+    results = (
+        ((i, s), generate_speculative(model, draft_model, encode_prompt(prompt), MAX_NEW_TOKENS, NUM_DRAFT_TOKENS,
+                                      eos_token_id=tokenizer.eos_token_id, stop_after_id=GAME_END_ID)[0], None, None)
+        for i, prompt in enumerate(PROMPTS) for s in range(NUM_SAMPLES)
+    )
+elif hasattr(model, "generate"):
+    results = generate_all(PROMPTS)
+else:
+    # No KV cache (ONNX backend): one sequence at a time
+    results = (((i, s), generate_ids(prompt), None, None) for i, prompt in enumerate(PROMPTS) for s in range(NUM_SAMPLES))
 
-# Run and save output
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    for i, prompt in enumerate(PROMPTS):
-        f.write(f"--- Sample {i+1} ---\n")
-        f.write(f"Prompt: {prompt}\n")
-        tokens = generate(prompt)
+total = len(PROMPTS) * NUM_SAMPLES
+with open(OUTPUT_FILE, "w", encoding="utf-8") as f, \
+        open(SCORES_FILE if SCORE_WHILE_GENERATING else os.devnull, "w", encoding="utf-8") as scores_f, \
+        open(KDA_FILE if SCORE_WHILE_GENERATING else os.devnull, "w", newline="", encoding="utf-8") as kda_f:
+    kda_writer = csv.DictWriter(kda_f, fieldnames=["Match ID"] + ROLES)
+    kda_writer.writeheader()
 
+    for done, ((i, s), generated, token_scores, counter) in enumerate(results, start=1):
+        sample_idx = i * NUM_SAMPLES + s
+        tokens = decode_tokens(generated)
+        f.write(f"--- Sample {sample_idx + 1} ---\n")
+        f.write(f"Prompt: {PROMPTS[i]}\n")
         if tokens:
             f.write("Generated Tokens:\n")
             f.write(" ".join(tokens) + "\n")
         else:
             f.write("No generation beyond the prompt.\n")
-
         f.write("\n")
+        f.flush()
+
+        if token_scores is not None:
+            # Values line up with token_ids; the prompt is the context of the first one
+            scores_f.write(json.dumps({
+                "sample": sample_idx + 1,
+                "token_ids": generated,
+                "log_probs": [round(lp, 6) for lp, _ in token_scores],
+                "role_log_probs": [round(rlp, 6) for _, rlp in token_scores],
+            }) + "\n")
+            scores_f.flush()
+            kda_writer.writerow({"Match ID": sample_idx, **counter.kda()})
+            kda_f.flush()
+
+        print(f"Finished sample {done}/{total} ({len(generated)} tokens)")
 
 print(f"Done. Results saved to {OUTPUT_FILE}")
@@ -0,0 +1,103 @@
+import os
+import torch
+from types import SimpleNamespace
+from transformers import AutoConfig, GPTNeoXForCausalLM
+
+# Setup
+MODEL_PATH = "../model/lol-model-neox"
+
+# Inference precision shared by the eval scripts: "fp32" loads the checkpoint as-is, "int8"
+# swaps every nn.Linear for a dynamically quantized one (CPU only).
+# Set LOL_QUANTIZE=int8 to switch eval_surprise, eval_single, eval_neo and generate at once.
+QUANTIZE = os.environ.get("LOL_QUANTIZE", "fp32")
+# Runtime backend: "torch" (eager Hugging Face model) or "onnx" (exported graph on ONNX Runtime,
+# see export_onnx). Set LOL_BACKEND=onnx to switch the same scripts.
+BACKEND = os.environ.get("LOL_BACKEND", "torch")
+ONNX_THREADS = int(os.environ.get("LOL_ONNX_THREADS", "0"))  # 0 lets ONNX Runtime decide
+
+def quantize_int8(model):
+    # Weights stored as int8, activations quantized on the fly per batch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def onnx_path(model_path):
+    # Next to the checkpoint, not inside it, so checkpoint hashes stay the same
+    return model_path.rstrip("/") + ".onnx"
+
+class LogitsOnly(torch.nn.Module):
+    # Export wrapper: (input_ids, attention_mask) -> logits, no KV cache outputs
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+def export_onnx(model_path=MODEL_PATH, path=None, opset=17):
+    # Static inference graph with dynamic batch and sequence length
+    path = path or onnx_path(model_path)
+    model = GPTNeoXForCausalLM.from_pretrained(model_path).cpu().eval()
+    input_ids = torch.zeros((2, 16), dtype=torch.long)
+    attention_mask = torch.ones_like(input_ids)
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnly(model), (input_ids, attention_mask), path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset,
+        )
+    return path
+
+class OnnxBackend:
+    # Runs the exported graph with ONNX Runtime behind the subset of the model interface the
+    # scorers use: model(input_ids, attention_mask=...).logits, model.device, model.config.
+    # There is no KV cache, so callers needing past_key_values must use the torch backend.
+
+    def __init__(self, model_path=MODEL_PATH, path=None, threads=ONNX_THREADS):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path or onnx_path(model_path), options, providers=["CPUExecutionProvider"])
+        self.config = AutoConfig.from_pretrained(model_path)
+        self.device = torch.device("cpu")
+
+    def __call__(self, input_ids, attention_mask=None, **kwargs):
+        if kwargs.get("past_key_values") is not None:
+            raise NotImplementedError("The ONNX backend has no KV cache; use LOL_BACKEND=torch")
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        logits = self.session.run(["logits"], {
+            "input_ids": input_ids.cpu().numpy(),
+            "attention_mask": attention_mask.cpu().numpy(),
+        })[0]
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+def load_model(model_path, device=None, quantize=None, backend=None):
+    quantize = quantize or QUANTIZE
+    backend = backend or BACKEND
+    if backend == "onnx":
+        if quantize != "fp32":
+            raise ValueError("LOL_QUANTIZE applies to the torch backend only")
+        return OnnxBackend(model_path)
+    if backend != "torch":
+        raise ValueError(f"Unknown backend: {backend}")
+
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = GPTNeoXForCausalLM.from_pretrained(model_path)
+    if quantize == "int8":
+        return quantize_int8(model.cpu().eval())
+    if quantize != "fp32":
+        raise ValueError(f"Unknown quantization mode: {quantize}")
+    return model.to(device).eval()
+
+# Export the checkpoint for LOL_BACKEND=onnx
+if __name__ == "__main__":
+    print(f"Exported {MODEL_PATH} to {export_onnx()}")
@@ -0,0 +1,146 @@
+import random
+import torch
+from collections import defaultdict, deque
+from datasets import load_dataset
+
+from eval_surprise import (
+    model, tokenizer, custom_split,
+    SURPRISE_EVENT_HEADS, ROLE_TOKENS,
+    compute_event_surprise, compute_role_surprise,
+    is_event_boundary, assign_surprise_by_event,
+)
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+MAX_LIVE_CONTEXT = model.config.max_position_embeddings  # KV cache never holds more tokens than this
+KEEP_CONTEXT = 2048  # Tokens re-encoded as context when the cache is full
+
+class LiveSurpriseScorer:
+    # Scores a match while it is being played. Each feed() runs the model on the new tokens
+    # only, reusing past_key_values, and returns the per-role score deltas of every event
+    # that closed in that chunk. An event closes at the next event head, [FRAME] or [GAME_*],
+    # because its role tokens can arrive in a later chunk than its head.
+    # When the cache would exceed max_context tokens it is rebuilt from the last keep_context
+    # tokens, so memory per match stays bounded (see memory_bytes / max_memory_bytes).
+
+    def __init__(self, max_context=MAX_LIVE_CONTEXT, keep_context=KEEP_CONTEXT):
+        assert keep_context < max_context
+        self.max_context = max_context
+        self.keep_context = keep_context
+        self.scores = defaultdict(float)
+        self.position = 0
+        self._past = None
+        self._cache_len = 0
+        self._next_logits = None
+        self._recent_ids = deque(maxlen=keep_context)
+        self._open_event = None  # (head token, event surprise, role positions, role surprises)
+
+    def _forward(self, ids):
+        # Next-token logits for every id in ids, given everything fed before.
+        if self._cache_len + len(ids) > self.max_context:
+            # Rebuild the cache from the most recent tokens; positions restart at 0
+            context = list(self._recent_ids)
+            self._past, self._cache_len = None, 0
+            if context:
+                self._run(context)
+
+        logits = self._run(ids)
+        self._recent_ids.extend(ids)
+        return logits
+
+    def _run(self, ids):
+        input_tensor = torch.tensor([ids], device=model.device)
+        with torch.no_grad():
+            outputs = model(input_tensor, past_key_values=self._past, use_cache=True)
+        self._past = outputs.past_key_values
+        self._cache_len += len(ids)
+        return outputs.logits[0]
+
+    def _close_event(self, deltas):
+        token, event_surprise, roles, role_surprises = self._open_event
+        assign_surprise_by_event(token, event_surprise, role_surprises, roles, deltas)
+        self._open_event = None
+
+    def feed(self, tokens):
+        # tokens: the next chunk of the match, e.g. one [FRAME] and its events
+        deltas = defaultdict(float)
+        if not tokens:
+            return deltas
+
+        input_ids = tokenizer.convert_tokens_to_ids(tokens)
+        # Very long chunks are split so a single forward never overflows the cache
+        step = self.max_context - self.keep_context
+        logits = torch.cat([self._forward(input_ids[i:i + step]) for i in range(0, len(input_ids), step)])
+
+        for j, (token, token_id) in enumerate(zip(tokens, input_ids)):
+            prev_logits = self._next_logits if j == 0 else logits[j - 1]
+            idx = self.position + j
+
+            if self._open_event is not None and is_event_boundary(token):
+                self._close_event(deltas)
+
+            # Like evaluate_surprise, the very first token of the match is never scored
+            if prev_logits is None:
+                continue
+
+            if token in SURPRISE_EVENT_HEADS:
+                self._open_event = (token, compute_event_surprise(prev_logits, token_id), [], {})
+            elif self._open_event is not None and token in ROLE_TOKENS:
+                _, _, roles, role_surprises = self._open_event
+                roles.append((idx, token))
+                role_surprises[idx] = compute_role_surprise(prev_logits, token_id)
+
+        self._next_logits = logits[-1]
+        self.position += len(tokens)
+        for role, delta in deltas.items():
+            self.scores[role] += delta
+        return deltas
+
+    def finish(self):
+        # Closes the last event once the match is over; returns its deltas.
+        deltas = defaultdict(float)
+        if self._open_event is not None:
+            self._close_event(deltas)
+        for role, delta in deltas.items():
+            self.scores[role] += delta
+        return deltas
+
+    def memory_bytes(self):
+        # Current KV cache size
+        if self._past is None:
+            return 0
+        return sum(t.nbytes for layer in self._past for t in layer)
+
+    def max_memory_bytes(self):
+        # Upper bound on the KV cache: keys and values for max_context tokens in every layer
+        config = model.config
+        element_size = next(model.parameters()).element_size()
+        return 2 * config.num_hidden_layers * self.max_context * config.hidden_size * element_size
+
+def split_frames(tokens):
+    # Splits a tokenized match into live chunks, one per [FRAME]
+    chunk = []
+    for token in tokens:
+        if token == "[FRAME]" and chunk:
+            yield chunk
+            chunk = []
+        chunk.append(token)
+    if chunk:
+        yield chunk
+
+# Replay one evaluation match frame by frame
+if __name__ == "__main__":
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    tokens = custom_split(random.choice(eval_dataset)["text"])
+
+    scorer = LiveSurpriseScorer()
+    for frame_idx, chunk in enumerate(split_frames(tokens)):
+        deltas = scorer.feed(chunk)
+        changed = ", ".join(f"{role} {delta:+.2f}" for role, delta in sorted(deltas.items()))
+        print(f"Frame {frame_idx:3d} | {len(chunk):4d} tokens | KV cache {scorer.memory_bytes() / 2**20:6.2f} MiB | {changed}")
+    scorer.finish()
+
+    print(f"\nKV cache bound per live match: {scorer.max_memory_bytes() / 2**20:.2f} MiB")
+    print("Final scores:")
+    for role in sorted(ROLE_TOKENS):
+        print(f"   {role}: {scorer.scores.get(role, 0.0):.2f}")
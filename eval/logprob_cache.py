@@ -0,0 +1,145 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+import torch
+from datasets import load_dataset
+from tqdm import tqdm
+
+from inference import QUANTIZE, BACKEND
+from eval_surprise import (
+    MODEL_PATH, BATCH_TOKEN_BUDGET, ROLE_COLUMNS, LONG_WINDOW, LONG_OVERLAP, model, tokenizer, custom_split,
+    batched_log_probs, role_score_matrix, score_row_to_dict,
+)
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+OUTPUT_CSV = "match_surprise.csv"
+CACHE_DIR = "logprob_cache"
+MAX_CACHE_BYTES = 4 * 2**30
+
+# One record per token position; see eval_surprise.position_log_probs
+ENTRY_DTYPE = np.dtype([("token_id", "<u2"), ("log_prob", "<f4"), ("role_log_prob", "<f4")])
+
+def checkpoint_hash(model_path, quantize=QUANTIZE, backend=BACKEND,
+                    long_window=LONG_WINDOW, long_overlap=LONG_OVERLAP):
+    # Content hash of every file in the checkpoint directory (config + weights), plus the
+    # load_model settings (int8 or ONNX models built from the same files give other log-probs)
+    # and the sliding windows that score matches longer than long_window
+    digest = hashlib.sha256()
+    digest.update(f"quantize={quantize};backend={backend}".encode())
+    digest.update(f"long_window={long_window};long_overlap={long_overlap}".encode())
+    for name in sorted(os.listdir(model_path)):
+        path = os.path.join(model_path, name)
+        if not os.path.isfile(path):
+            continue
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+def match_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+class LogProbCache:
+    # Per-position log-probs of each match, one .npy file per (checkpoint, match content).
+    # Files are opened memory-mapped, and the least recently used ones are evicted once the
+    # cache grows beyond max_bytes. A new checkpoint, quantization, backend or sliding window
+    # gets its own subdirectory, so entries computed another way are never read.
+
+    def __init__(self, cache_dir=CACHE_DIR, model_path=MODEL_PATH, max_bytes=MAX_CACHE_BYTES,
+                 quantize=QUANTIZE, backend=BACKEND, long_window=LONG_WINDOW, long_overlap=LONG_OVERLAP):
+        self.root = cache_dir
+        key = checkpoint_hash(model_path, quantize, backend, long_window, long_overlap)
+        self.dir = os.path.join(cache_dir, key)
+        self.max_bytes = max_bytes
+        os.makedirs(self.dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        for sub in os.scandir(self.root):
+            if sub.is_dir():
+                yield from (entry for entry in os.scandir(sub.path) if entry.name.endswith(".npy"))
+
+    def path(self, text):
+        return os.path.join(self.dir, match_hash(text) + ".npy")
+
+    def get(self, text):
+        path = self.path(text)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # Mark as recently used
+        return np.load(path, mmap_mode="r")
+
+    def put(self, text, token_ids, log_probs, role_log_probs):
+        entry = np.empty(len(token_ids), dtype=ENTRY_DTYPE)
+        entry["token_id"] = token_ids
+        entry["log_prob"] = log_probs
+        entry["role_log_prob"] = role_log_probs
+
+        path = self.path(text)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, entry)
+        os.replace(tmp_path, path)
+        self.total_bytes += os.path.getsize(path)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Drop least recently used entries (any checkpoint) until under max_bytes
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.total_bytes -= entry.stat().st_size
+            os.remove(entry.path)
+
+def fill_cache(cache, texts, token_budget=BATCH_TOKEN_BUDGET):
+    # Runs the model only over matches that are not cached yet
+    missing = [i for i, text in enumerate(texts) if cache.get(text) is None]
+    if not missing:
+        return
+    id_lists = [tokenizer.convert_tokens_to_ids(custom_split(texts[i])) for i in missing]
+
+    progress = tqdm(total=len(missing), desc="Caching log-probs")
+    for batch, input_tensor, log_probs, role_log_probs in batched_log_probs(id_lists, token_budget):
+        log_probs, role_log_probs = log_probs.cpu().numpy(), role_log_probs.cpu().numpy()
+        for row, j in enumerate(batch):
+            n = len(id_lists[j])
+            cache.put(texts[missing[j]], id_lists[j], log_probs[row, :n], role_log_probs[row, :n])
+        progress.update(len(batch))
+    progress.close()
+
+def scores_from_entry(entry):
+    # Re-weights one cached match with the current EVENT_WEIGHTS / EVENT_ROLE_RATIO / sign rules
+    input_ids = torch.from_numpy(entry["token_id"].astype(np.int64)).unsqueeze(0).to(model.device)
+    log_probs = torch.from_numpy(np.ascontiguousarray(entry["log_prob"])).unsqueeze(0).to(model.device)
+    role_log_probs = torch.from_numpy(np.ascontiguousarray(entry["role_log_prob"])).unsqueeze(0).to(model.device)
+    return score_row_to_dict(role_score_matrix(input_ids, log_probs, role_log_probs)[0])
+
+# === Cached evaluation: forward passes only for new matches, then re-weight from cache ===
+if __name__ == "__main__":
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    texts = [row["text"] for row in eval_dataset]
+
+    cache = LogProbCache()
+    fill_cache(cache, texts)
+
+    match_rows = []
+    for idx, text in enumerate(tqdm(texts, desc="Re-weighting")):
+        entry = cache.get(text)
+        if entry is None:
+            # Evicted during this run (cache smaller than the dataset)
+            fill_cache(cache, [text])
+            entry = cache.get(text)
+        role_scores = scores_from_entry(entry)
+        match_result = {"Match ID": idx}
+        for role in ROLE_COLUMNS:
+            match_result[role] = role_scores.get(role, 0.0)
+        match_rows.append(match_result)
+
+    df = pd.DataFrame(match_rows)
+    df.to_csv(OUTPUT_CSV, float_format="%.2f", index=False)
+    print(f"\n✅ Saved all surprise scores to {OUTPUT_CSV} ({cache.total_bytes / 2**20:.1f} MiB cached)")
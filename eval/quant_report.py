@@ -0,0 +1,77 @@
+import copy
+import time
+import numpy as np
+import pandas as pd
+from datasets import load_dataset
+from scipy.stats import spearmanr
+
+import eval_surprise
+from eval_surprise import BATCH_TOKEN_BUDGET, ROLE_COLUMNS, custom_split, evaluate_surprise_batched
+from compute_kda import kda_from_tokens
+from inference import QUANTIZE, quantize_int8
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+OUTPUT_CSV = "quant_report.csv"
+NUM_MATCHES = 200  # Fixed sample: the first matches of the eval split
+TEAMS = {"B": [r for r in ROLE_COLUMNS if r.endswith("_B]")], "R": [r for r in ROLE_COLUMNS if r.endswith("_R]")]}
+
+def score_with(model, token_lists):
+    # The scoring functions read eval_surprise.model, so swap it for the run
+    eval_surprise.model = model
+    start = time.perf_counter()
+    scores = evaluate_surprise_batched(token_lists, BATCH_TOKEN_BUDGET)
+    return scores, time.perf_counter() - start
+
+def team_spearman(kda_rows, score_rows):
+    # Same per-team correlation as compare_kda.py
+    correlations = []
+    for kda, scores in zip(kda_rows, score_rows):
+        for roles in TEAMS.values():
+            kda_vals = [kda[r] for r in roles]
+            surprise_vals = [scores.get(r, 0.0) for r in roles]
+            if len(set(kda_vals)) > 1 and len(set(surprise_vals)) > 1:
+                correlations.append(spearmanr(kda_vals, surprise_vals)[0])
+            else:
+                correlations.append(np.nan)
+    return np.array(correlations)
+
+# Accuracy and speed of int8 dynamic quantization vs fp32
+if __name__ == "__main__":
+    assert QUANTIZE == "fp32", "Run the report with the fp32 checkpoint (unset LOL_QUANTIZE)"
+    assert eval_surprise.model.device.type == "cpu", "Dynamic int8 quantization is CPU-only"
+
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    texts = [eval_dataset[idx]["text"] for idx in range(min(NUM_MATCHES, len(eval_dataset)))]
+    token_lists = [custom_split(text) for text in texts]
+
+    fp32_model = eval_surprise.model
+    int8_model = quantize_int8(copy.deepcopy(fp32_model))
+    fp32_scores, fp32_time = score_with(fp32_model, token_lists)
+    int8_scores, int8_time = score_with(int8_model, token_lists)
+    eval_surprise.model = fp32_model
+
+    rows = []
+    for idx, (fp32, int8) in enumerate(zip(fp32_scores, int8_scores)):
+        for role in ROLE_COLUMNS:
+            rows.append({"Match ID": idx, "Role": role, "FP32": fp32[role], "INT8": int8[role]})
+    df = pd.DataFrame(rows)
+    df["Diff"] = df["INT8"] - df["FP32"]
+    df.to_csv(OUTPUT_CSV, float_format="%.4f", index=False)
+
+    kda_rows = [kda_from_tokens(text) for text in texts]
+    fp32_rho = team_spearman(kda_rows, fp32_scores)
+    int8_rho = team_spearman(kda_rows, int8_scores)
+    both = ~np.isnan(fp32_rho) & ~np.isnan(int8_rho)
+
+    total_tokens = sum(len(tokens) for tokens in token_lists)
+    print(f"\nSample: {len(texts)} matches, {total_tokens} tokens")
+    print(f"Speed:  fp32 {total_tokens / fp32_time:,.0f} tok/s | int8 {total_tokens / int8_time:,.0f} tok/s "
+          f"| speedup x{fp32_time / int8_time:.2f}")
+    print("Per-role surprise score (int8 - fp32):")
+    print(f"   mean |diff| {df['Diff'].abs().mean():.4f} | max |diff| {df['Diff'].abs().max():.4f} "
+          f"| correlation {df['FP32'].corr(df['INT8']):.5f}")
+    print("Per-team KDA Spearman:")
+    print(f"   fp32 mean {np.nanmean(fp32_rho):.4f} | int8 mean {np.nanmean(int8_rho):.4f} "
+          f"| mean |diff| {np.abs(fp32_rho[both] - int8_rho[both]).mean():.4f} over {both.sum()} teams")
+    print(f"\n✅ Saved per-role comparison to {OUTPUT_CSV}")
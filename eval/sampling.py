@@ -0,0 +1,268 @@
+import torch
+from collections import OrderedDict
+from transformers import DynamicCache
+
+# Sampling loops shared by generate.py and the rollout tools. Everything takes the model
+# explicitly, so importing this module never loads a checkpoint.
+
+def sample_top_p(logits, top_p=0.9, temperature=1.0):
+    # logits [batch, vocab] -> next token ids [batch]; same nucleus rule as model.generate
+    logits = logits / temperature
+    sorted_logits, sorted_idx = logits.sort(dim=-1, descending=True)
+    sorted_probs = sorted_logits.softmax(dim=-1)
+    # Keep the smallest set of tokens whose probability mass reaches top_p
+    sorted_logits[sorted_probs.cumsum(dim=-1) - sorted_probs > top_p] = float("-inf")
+    choice = torch.multinomial(sorted_logits.softmax(dim=-1), 1)
+    return sorted_idx.gather(-1, choice).squeeze(-1)
+
+def left_pad(id_lists, pad_token_id, device):
+    # Left padding keeps every row's last prompt token in the final column
+    max_len = max(len(ids) for ids in id_lists)
+    input_ids = torch.full((len(id_lists), max_len), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(id_lists), max_len), dtype=torch.long)
+    for row, ids in enumerate(id_lists):
+        input_ids[row, max_len - len(ids):] = torch.tensor(ids)
+        attention_mask[row, max_len - len(ids):] = 1
+    return input_ids.to(device), attention_mask.to(device)
+
+def select_cache_rows(past_key_values, rows):
+    # Keeps only the given batch rows of a KV cache (Cache object or legacy tuples)
+    if hasattr(past_key_values, "batch_select_indices"):
+        past_key_values.batch_select_indices(rows)
+        return past_key_values
+    return tuple(tuple(t[rows] for t in layer) for layer in past_key_values)
+
+def generate_uncached(model, input_ids, max_new_tokens, top_p=0.9, temperature=1.0,
+                      eos_token_id=None, stop_after_id=None, logits_processor=None):
+    # For backends without a KV cache (LOL_BACKEND=onnx): every step re-runs the whole sequence
+    for _ in range(max_new_tokens):
+        with torch.no_grad():
+            logits = model(input_ids).logits[:, -1]
+        if logits_processor is not None:
+            logits = logits_processor(input_ids, logits)
+        next_id = sample_top_p(logits, top_p, temperature).unsqueeze(-1)
+        input_ids = torch.cat([input_ids, next_id], dim=-1)
+        if eos_token_id is not None and next_id.item() == eos_token_id:
+            break
+        if stop_after_id is not None and input_ids[0, -2].item() == stop_after_id:
+            break
+    return input_ids
+
+def decode_loop(model, past_key_values, logits, attention_mask, position_ids, sequences,
+                max_new_tokens=4000, top_p=0.9, temperature=1.0, eos_token_id=None,
+                stop_after_id=None, logits_processor=None, score_fn=None, on_token=None):
+    # Step loop shared by the batched samplers. logits [batch, vocab] are every row's
+    # next-token logits after `sequences`, whose keys/values are in past_key_values.
+    # Yields (row index, generated ids) as soon as a sequence finishes; finished rows are
+    # dropped from the batch and its KV cache, so later steps only pay for the live ones.
+    # A sequence finishes at eos_token_id, one token after stop_after_id ([GAME_END] is
+    # followed by the winning team), or at max_new_tokens.
+    # logits_processor gets (sequences so far, next-token logits) like a HF LogitsProcessor.
+    # score_fn(model logits, sampled ids) -> [batch, k] values recorded for every generated
+    # token, from the unprocessed model distribution; with it, each finished row is yielded as
+    # (row, generated ids, per-token value tuples). on_token(row, token_id) sees every token
+    # as it is sampled.
+    generated = [[] for _ in range(sequences.shape[0])]
+    token_scores = [[] for _ in range(sequences.shape[0])]
+    active = list(range(sequences.shape[0]))
+
+    for step in range(max_new_tokens):
+        model_logits = logits
+        if logits_processor is not None:
+            logits = logits_processor(sequences, logits)
+        next_ids = sample_top_p(logits, top_p, temperature)
+        step_scores = score_fn(model_logits, next_ids).tolist() if score_fn is not None else None
+
+        keep = []
+        for r, token_id in enumerate(next_ids.tolist()):
+            row = active[r]
+            generated[row].append(token_id)
+            if on_token is not None:
+                on_token(row, token_id)
+            if step_scores is not None:
+                token_scores[row].append(tuple(step_scores[r]))
+            stopped = stop_after_id is not None and len(generated[row]) >= 2 and generated[row][-2] == stop_after_id
+            if token_id == eos_token_id or stopped or step == max_new_tokens - 1:
+                yield (row, generated[row], token_scores[row]) if score_fn is not None else (row, generated[row])
+            else:
+                keep.append(r)
+
+        if not keep:
+            return
+        if len(keep) < len(active):
+            keep_idx = torch.tensor(keep, device=model.device)
+            next_ids = next_ids[keep_idx]
+            attention_mask = attention_mask[keep_idx]
+            position_ids = position_ids[keep_idx]
+            sequences = sequences[keep_idx]
+            past_key_values = select_cache_rows(past_key_values, keep_idx)
+            if hasattr(logits_processor, "select_rows"):
+                logits_processor.select_rows(keep)
+            active = [active[r] for r in keep]
+
+        step_ids = next_ids.unsqueeze(-1)
+        sequences = torch.cat([sequences, step_ids], dim=-1)
+        attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(active), 1))], dim=-1)
+        position_ids = position_ids[:, -1:] + 1
+        with torch.no_grad():
+            outputs = model(
+                step_ids,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+        past_key_values = outputs.past_key_values
+        logits = outputs.logits[:, -1]
+
+def generate_batch(model, prompt_id_lists, pad_token_id=0, **decode_kwargs):
+    # Samples one continuation per prompt (repeat a prompt for several samples) in a single
+    # left-padded batch; see decode_loop for what is yielded and decode_kwargs.
+    input_ids, attention_mask = left_pad(prompt_id_lists, pad_token_id, model.device)
+    # Positions count real tokens only, so padded rows line up with unpadded generation
+    position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+
+    with torch.no_grad():
+        outputs = model(input_ids, attention_mask=attention_mask, position_ids=position_ids, use_cache=True)
+    yield from decode_loop(
+        model, outputs.past_key_values, outputs.logits[:, -1],
+        attention_mask, position_ids, input_ids, **decode_kwargs
+    )
+
+def legacy_cache(past_key_values):
+    # ((key, value) per layer) tuples, whatever cache class the model returned
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(tuple(layer) for layer in past_key_values)
+
+class PrefixCache:
+    # Encodes each distinct prompt once and keeps its KV cache and last-position logits, so
+    # samples and rollouts from the same prompt skip the prompt forward. fork() hands out a
+    # batch of expanded views: the shared prefix is only copied when the first generated
+    # token is appended. At most max_prefixes prompts are kept, least recently used first out.
+
+    def __init__(self, model, max_prefixes=8):
+        self.model = model
+        self.max_prefixes = max_prefixes
+        self._entries = OrderedDict()
+
+    def get(self, prompt_ids):
+        key = tuple(prompt_ids)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        input_ids = torch.tensor([prompt_ids], device=self.model.device)
+        with torch.no_grad():
+            outputs = self.model(input_ids, use_cache=True)
+        # clone: a view of the last position would keep all [1, prompt_len, vocab] logits alive
+        entry = (legacy_cache(outputs.past_key_values), outputs.logits[:, -1].clone())
+        self._entries[key] = entry
+        while len(self._entries) > self.max_prefixes:
+            self._entries.popitem(last=False)
+        return entry
+
+    def fork(self, prompt_ids, num_rows):
+        # (past_key_values, logits) for num_rows copies of the prompt
+        past, logits = self.get(prompt_ids)
+        forked = tuple(tuple(t.expand(num_rows, *t.shape[1:]) for t in layer) for layer in past)
+        return DynamicCache.from_legacy_cache(forked), logits.expand(num_rows, -1)
+
+    def memory_bytes(self):
+        # KV tensors plus the stored last-position logits
+        return sum(sum(t.nbytes for layer in past for t in layer) + logits.nbytes
+                   for past, logits in self._entries.values())
+
+def generate_from_prefix(model, prefix_cache, prompt_ids, num_samples, **decode_kwargs):
+    # num_samples continuations of one prompt, starting from its cached KV state;
+    # see decode_loop for what is yielded and decode_kwargs
+    past_key_values, logits = prefix_cache.fork(prompt_ids, num_samples)
+    sequences = torch.tensor([prompt_ids], device=model.device).expand(num_samples, -1)
+    attention_mask = torch.ones_like(sequences)
+    position_ids = torch.arange(len(prompt_ids), device=model.device).expand(num_samples, -1)
+    yield from decode_loop(model, past_key_values, logits, attention_mask, position_ids, sequences, **decode_kwargs)
+
+def top_p_probs(logits, top_p=0.9, temperature=1.0):
+    # The distribution sample_top_p draws from, as probabilities in vocab order
+    logits = logits / temperature
+    sorted_logits, sorted_idx = logits.sort(dim=-1, descending=True)
+    sorted_probs = sorted_logits.softmax(dim=-1)
+    sorted_probs[sorted_probs.cumsum(dim=-1) - sorted_probs > top_p] = 0.0
+    sorted_probs = sorted_probs / sorted_probs.sum(dim=-1, keepdim=True)
+    return torch.zeros_like(sorted_probs).scatter(-1, sorted_idx, sorted_probs)
+
+def crop_cache(past_key_values, length):
+    # Drops every cached position from `length` on (Cache object or legacy tuples)
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    return tuple(tuple(t[:, :, :length] for t in layer) for layer in past_key_values)
+
+def generate_speculative(model, draft_model, prompt_ids, max_new_tokens=4000, num_draft=4, top_p=0.9,
+                         temperature=1.0, eos_token_id=None, stop_after_id=None):
+    # Speculative sampling for one sequence. Each round draft_model proposes num_draft tokens,
+    # model scores all of them in a single forward, and each proposal d is kept with
+    # probability min(1, p(d) / q(d)). The first rejected one is replaced by a sample from
+    # max(p - q, 0) renormalized; if all are kept, one more token is sampled from p. The output
+    # is distributed exactly like sample_top_p on model alone; only the number of full-model
+    # forwards changes. Stops like decode_loop. Returns (generated ids, stats).
+    tokens = list(prompt_ids)
+    prompt_len = len(tokens)
+    target_past, target_len = None, 0
+    draft_past, draft_len = None, 0
+    stats = {"rounds": 0, "drafted": 0, "accepted": 0}
+
+    def forward(m, past, ids):
+        with torch.no_grad():
+            outputs = m(torch.tensor([ids], device=m.device), past_key_values=past, use_cache=True)
+        return outputs.past_key_values, outputs.logits[0]
+
+    while len(tokens) - prompt_len < max_new_tokens:
+        # Leave room for the token the target model adds every round
+        k = min(num_draft, max_new_tokens - (len(tokens) - prompt_len) - 1)
+
+        drafts, draft_probs = [], []
+        feed = tokens[draft_len:]
+        for _ in range(k):
+            draft_past, logits = forward(draft_model, draft_past, feed)
+            draft_len += len(feed)
+            q = top_p_probs(logits[-1].float(), top_p, temperature)
+            drafts.append(torch.multinomial(q, 1).item())
+            draft_probs.append(q)
+            feed = drafts[-1:]
+
+        # Not-yet-cached tokens plus every proposal; the last k + 1 logits judge the proposals
+        target_past, logits = forward(model, target_past, tokens[target_len:] + drafts)
+        target_probs = top_p_probs(logits[-(k + 1):].float(), top_p, temperature)
+
+        new = []
+        for i, d in enumerate(drafts):
+            p, q = target_probs[i], draft_probs[i]
+            if torch.rand(()).item() * q[d] < p[d]:
+                new.append(d)
+                continue
+            residual = (p - q).clamp(min=0)
+            new.append(torch.multinomial(residual / residual.sum(), 1).item())
+            break
+        else:
+            new.append(torch.multinomial(target_probs[k], 1).item())
+
+        stats["rounds"] += 1
+        stats["drafted"] += k
+        stats["accepted"] += len(new) - 1
+
+        # Both caches keep the old tokens and the accepted proposals only
+        target_len = len(tokens) + len(new) - 1
+        target_past = crop_cache(target_past, target_len)
+        if draft_len > target_len:
+            draft_len = target_len
+            draft_past = crop_cache(draft_past, draft_len)
+
+        for token_id in new:
+            tokens.append(token_id)
+            generated = tokens[prompt_len:]
+            stopped = stop_after_id is not None and len(generated) >= 2 and generated[-2] == stop_after_id
+            if token_id == eos_token_id or stopped:
+                return generated, stats
+
+    return tokens[prompt_len:], stats
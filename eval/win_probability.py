@@ -0,0 +1,101 @@
+import math
+import random
+import time
+from collections import defaultdict
+from datasets import load_dataset
+
+from eval_surprise import model, tokenizer, custom_split, ROLE_TOKENS
+from compute_kda import kda_from_tokens
+from sampling import PrefixCache, generate_from_prefix
+
+# Setup
+EVAL_FILE = "../data/eval_tokens.txt"
+NUM_ROLLOUTS = 256
+ROLLOUT_BATCH_SIZE = 256  # Rollouts decoded together (bounds KV cache memory)
+MAX_CACHED_PREFIXES = 4
+CONFIDENCE_Z = 1.96  # 95% interval
+PREFIX_FRACTION = 0.5  # Demo: how much of the match is "already played"
+
+GAME_END_ID = tokenizer.convert_tokens_to_ids("[GAME_END]")
+WINNER_TOKENS = {"[TEAM100]": True, "[TEAM200]": False}
+
+prefix_cache = PrefixCache(model, MAX_CACHED_PREFIXES)
+
+def wilson_interval(wins, n, z=CONFIDENCE_Z):
+    # Score interval for a binomial proportion; stays inside [0, 1] for small n or p near 0/1
+    if n == 0:
+        return 0.0, 1.0
+    p = wins / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+def rollout_winner(generated_tokens):
+    # True if TEAM100 won, False if TEAM200 won, None if the rollout never reached [GAME_END]
+    for i, token in enumerate(generated_tokens[:-1]):
+        if token == "[GAME_END]":
+            return WINNER_TOKENS.get(generated_tokens[i + 1])
+    return None
+
+def estimate_win_probability(prefix_tokens, num_rollouts=NUM_ROLLOUTS, batch_size=ROLLOUT_BATCH_SIZE,
+                             top_p=0.9, temperature=1.0, logits_processor_factory=None):
+    # prefix_tokens: a match so far, split like the token_processor.py output (custom_split).
+    # Samples num_rollouts continuations until [GAME_END][TEAMx]; the prefix is encoded once
+    # and its KV cache is shared by every rollout batch.
+    # Returns P(TEAM100 wins) over the decided rollouts with its confidence interval, and the
+    # mean projected KDA per role (compute_kda.kda_from_tokens on prefix + rollout).
+    prefix_ids = tokenizer.convert_tokens_to_ids(prefix_tokens)
+    max_new_tokens = model.config.max_position_embeddings - len(prefix_ids)
+    assert max_new_tokens > 0, "Prefix fills the model context"
+
+    wins, decided = 0, 0
+    kda_sums = defaultdict(float)
+    for start in range(0, num_rollouts, batch_size):
+        rows = min(batch_size, num_rollouts - start)
+        finished = generate_from_prefix(
+            model, prefix_cache, prefix_ids, rows,
+            max_new_tokens=max_new_tokens,
+            top_p=top_p,
+            temperature=temperature,
+            stop_after_id=GAME_END_ID,
+            logits_processor=logits_processor_factory() if logits_processor_factory else None,
+        )
+        for _, generated_ids in finished:
+            generated = tokenizer.convert_ids_to_tokens(generated_ids)
+            winner = rollout_winner(generated)
+            if winner is not None:
+                wins += winner
+                decided += 1
+            for role, kda in kda_from_tokens(" ".join(prefix_tokens + generated)).items():
+                kda_sums[role] += kda
+
+    low, high = wilson_interval(wins, decided)
+    return {
+        "p_team100": wins / decided if decided else float("nan"),
+        "ci_low": low,
+        "ci_high": high,
+        "rollouts": num_rollouts,
+        "decided": decided,
+        "projected_kda": {role: kda_sums[role] / num_rollouts for role in kda_sums},
+    }
+
+# Demo: estimate the winner halfway through a random eval match
+if __name__ == "__main__":
+    eval_dataset = load_dataset("text", data_files={"validation": EVAL_FILE})["validation"]
+    tokens = custom_split(random.choice(eval_dataset)["text"])
+    cut = tokens.index("[GAME_END]") if "[GAME_END]" in tokens else len(tokens)
+    prefix = tokens[:int(cut * PREFIX_FRACTION)]
+    actual = rollout_winner(tokens)
+
+    start = time.perf_counter()
+    result = estimate_win_probability(prefix)
+    elapsed = time.perf_counter() - start
+
+    print(f"Prefix: {len(prefix)} of {len(tokens)} tokens | {result['rollouts']} rollouts in {elapsed:.2f}s "
+          f"({result['decided']} reached [GAME_END])")
+    print(f"P(TEAM100 wins) = {result['p_team100']:.3f} "
+          f"[{result['ci_low']:.3f}, {result['ci_high']:.3f}] | actual winner: "
+          f"{'TEAM100' if actual else 'TEAM200' if actual is False else 'unknown'}")
+    print("Projected KDA:")
+    for role in sorted(ROLE_TOKENS):
+        print(f"   {role}: {result['projected_kda'].get(role, 0.0):.2f}")
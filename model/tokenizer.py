@@ -1,6 +1,6 @@
-from tokenizers import Tokenizer
+from tokenizers import Regex, Tokenizer
 from tokenizers.models import WordLevel
-from tokenizers.pre_tokenizers import Sequence, Split, Whitespace
+from tokenizers.pre_tokenizers import Sequence, Split, WhitespaceSplit
 from tokenizers.processors import BertProcessing
 from transformers import PreTrainedTokenizerFast
 import json
@@ -15,13 +15,13 @@ vocab_dict = {token: i for i, token in enumerate(vocab)}
 # Build tokenizer
 tokenizer = Tokenizer(WordLevel(vocab=vocab_dict, unk_token="[UNK]"))
 
-# Custom pre-tokenizer to handle bracketed tokens without spaces
-# First split on '][' to separate adjacent tokens
-split_on_close_open = Split(r"\]\[", behavior="isolated")
-
-# Then split any remaining patterns (standalone bracketed tokens)
-split_bracketed = Split(r"(\[[^\[\]]+?\])", behavior="isolated")
-tokenizer.pre_tokenizer = Sequence([Whitespace(),split_on_close_open, split_bracketed])
+# Custom pre-tokenizer for text that is not a vocab token (those are matched whole first).
+# Split on whitespace, then keep each [..] span whole, so a token left out of the vocab
+# (vocab.py MIN_FREQUENCY) is one [UNK] rather than "[", "NAME", "]". Other text splits
+# like the Whitespace pre-tokenizer. Same pieces as data/token_ids.py SPAN_PIECE_RE.
+PIECE_PATTERN = r"\[[^\[\]\s]+\]|\w+|(?:(?!\[[^\[\]\s]+\])[^\w\s])+"
+split_pieces = Split(Regex(PIECE_PATTERN), behavior="isolated")
+tokenizer.pre_tokenizer = Sequence([WhitespaceSplit(), split_pieces])
 
 # Post-processor
 tokenizer.post_processor = BertProcessing(
@@ -50,8 +50,8 @@ with open("./my_tokenizer/tokenizer_config.json", "w") as f:
         "pre_tokenizer": {
             "type": "Sequence",
             "pretokenizers": [
-                {"type": "Split", "pattern": r"\]\[", "behavior": "isolated"},
-                {"type": "Split", "pattern": r"(\[[^\[\]]+?\])", "behavior": "isolated"}
+                {"type": "WhitespaceSplit"},
+                {"type": "Split", "pattern": PIECE_PATTERN, "behavior": "isolated"}
             ]
         }
     }, f, indent=2)
\ No newline at end of file
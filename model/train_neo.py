@@ -1,22 +1,49 @@
 # Training from scratch with custom tokenizer using GPTNeoXForCausalLM
 
 from transformers import PreTrainedTokenizerFast, GPTNeoXConfig, GPTNeoXForCausalLM, Trainer, TrainingArguments, DataCollatorForLanguageModeling
-from datasets import load_dataset
+from datasets import Dataset, load_dataset
 import torch
+import glob
+import hashlib
 import json
+import sys
+import numpy as np
 import matplotlib.pyplot as plt
 
+sys.path.append("../data")
+from token_ids import load_token_ids, match_ids
+from bracket_tokenizer import BracketTokenizer
+
+# "full" trains lol-model-neox; "draft" trains the small model that proposes tokens for
+# speculative decoding in eval/generate.py (same tokenizer and data, 2 narrow layers)
+MODEL_SIZE = "full"
+MODEL_SIZES = {
+    "full": dict(hidden_size=256, intermediate_size=1024, num_hidden_layers=6, num_attention_heads=8),
+    "draft": dict(hidden_size=128, intermediate_size=512, num_hidden_layers=2, num_attention_heads=4),
+}
+SUFFIX = "" if MODEL_SIZE == "full" else f"_{MODEL_SIZE}"
+OUTPUT_DIR = "./lol-model-neox" if MODEL_SIZE == "full" else f"./lol-model-neox-{MODEL_SIZE}"
+
+# Train on the token ids written by token_processor.py (WRITE_TOKEN_IDS) instead of
+# re-tokenizing processed_tokens.txt. Same ids, split and truncation as the text path.
+USE_TOKEN_IDS = False
+# Text input: processed_tokens.txt, or the shards of token_processor.py's incremental mode
+INCREMENTAL_SHARDS = False
+TOKENS_FILES = (sorted(glob.glob("../data/processed_shards/shard_*.txt")) if INCREMENTAL_SHARDS
+                else ["../data/processed_tokens.txt"])
+EVAL_FRACTION = 0.1  # Held-out share; shards are split per match_id so it stays held out as they grow
+TOKEN_IDS_FILE = "../data/processed_tokens.bin"
+TOKEN_INDEX_FILE = "../data/processed_tokens_index.npy"
+
 # Load custom tokenizer
 hf_tokenizer = PreTrainedTokenizerFast.from_pretrained("./my_tokenizer")
 hf_tokenizer.model_max_length = 8192
+bracket_tokenizer = BracketTokenizer.from_pretrained("./my_tokenizer")  # Same ids, encodes the text
 
 # Define a new model config for scratch training
 config = GPTNeoXConfig(
     vocab_size=len(hf_tokenizer),
-    hidden_size=256,
-    intermediate_size=1024,
-    num_hidden_layers=6,
-    num_attention_heads=8,
+    **MODEL_SIZES[MODEL_SIZE],
     max_position_embeddings=8192,
     rotary_pct=1.0,
     tie_word_embeddings=False,
@@ -25,25 +52,57 @@ config = GPTNeoXConfig(
 
 model = GPTNeoXForCausalLM(config)
 
-# Dataset loading (one full match per line)
-dataset = load_dataset("text", data_files={"train": "../data/processed_tokens.txt"})
-split_dataset = dataset["train"].train_test_split(test_size=0.1, seed=42)
-train_dataset = split_dataset["train"]
-eval_dataset = split_dataset["test"]
-
 # Tokenize full matches with truncation to 8192
 def tokenize(batch):
-    return hf_tokenizer(batch["text"], truncation=True, padding=False, max_length=8192)
-
-tokenized_train = train_dataset.map(tokenize, batched=True, remove_columns=["text"])
-tokenized_eval = eval_dataset.map(tokenize, batched=True, remove_columns=["text"])
+    input_ids = bracket_tokenizer.encode_rows(batch["text"], max_length=8192)
+    return {"input_ids": input_ids, "attention_mask": [np.ones_like(ids) for ids in input_ids]}
+
+def from_token_ids(batch):
+    # Rows of the token-id index -> input_ids, read straight from the memmap
+    input_ids = [match_ids(token_ids, token_index[i], add_special_tokens=True, max_length=8192) for i in batch["row"]]
+    return {"input_ids": input_ids, "attention_mask": [np.ones_like(ids) for ids in input_ids]}
+
+def is_eval_match(match_id):
+    # Held-out by a hash of the match_id, so a match stays in the same split however many
+    # shards are added around it
+    return int(hashlib.sha1(match_id.encode("utf-8")).hexdigest()[:8], 16) < EVAL_FRACTION * 16**8
+
+def split_by_match_id(dataset, tokens_files):
+    # Shard lines -> train/test by is_eval_match on the .ids sidecar (one match_id per line)
+    match_ids = []
+    for tokens_file in tokens_files:
+        with open(tokens_file[:-len(".txt")] + ".ids", "r") as f:
+            match_ids.extend(line.rstrip("\n") for line in f)
+    assert len(match_ids) == len(dataset), "Shard .txt and .ids files are out of sync"
+    in_eval = np.array([is_eval_match(match_id) for match_id in match_ids], dtype=bool)
+    return {"train": dataset.select(np.flatnonzero(~in_eval)), "test": dataset.select(np.flatnonzero(in_eval))}
+
+if USE_TOKEN_IDS:
+    # The split permutes row numbers exactly like the text rows below (same length and seed)
+    token_ids, token_index = load_token_ids(TOKEN_IDS_FILE, TOKEN_INDEX_FILE)
+    split_dataset = Dataset.from_dict({"row": np.arange(len(token_index))}).train_test_split(test_size=EVAL_FRACTION, seed=42)
+    train_dataset = split_dataset["train"]
+    eval_dataset = split_dataset["test"]
+    tokenized_train = train_dataset.map(from_token_ids, batched=True, remove_columns=["row"])
+    tokenized_eval = eval_dataset.map(from_token_ids, batched=True, remove_columns=["row"])
+else:
+    # Dataset loading (one full match per line)
+    dataset = load_dataset("text", data_files={"train": TOKENS_FILES})
+    if INCREMENTAL_SHARDS:
+        split_dataset = split_by_match_id(dataset["train"], TOKENS_FILES)
+    else:
+        split_dataset = dataset["train"].train_test_split(test_size=EVAL_FRACTION, seed=42)
+    train_dataset = split_dataset["train"]
+    eval_dataset = split_dataset["test"]
+    tokenized_train = train_dataset.map(tokenize, batched=True, remove_columns=["text"])
+    tokenized_eval = eval_dataset.map(tokenize, batched=True, remove_columns=["text"])
 
 # Data collator
 data_collator = DataCollatorForLanguageModeling(tokenizer=hf_tokenizer, mlm=False)
 
 # Training arguments
 training_args = TrainingArguments(
-    output_dir="./model_checkpoints_neox_10epochs",
+    output_dir=f"./model_checkpoints_neox{SUFFIX}_10epochs",
     overwrite_output_dir=True,
     num_train_epochs=10,
     per_device_train_batch_size=1,
@@ -72,8 +131,8 @@ trainer = Trainer(
 
 # Train
 trainer.train()
-trainer.save_model("./lol-model-neox")
-hf_tokenizer.save_pretrained("./lol-model-neox")
+trainer.save_model(OUTPUT_DIR)
+hf_tokenizer.save_pretrained(OUTPUT_DIR)
 
 # Plot training curve
 logs = sorted(trainer.state.log_history, key=lambda x: x.get("step", -1))
@@ -96,18 +155,23 @@ plt.legend()
 plt.grid(True)
 plt.title("Training and Validation Loss 10 Epochs")
 plt.tight_layout()
-plt.savefig("loss_plot_10epochs.png")
+plt.savefig(f"loss_plot{SUFFIX}_10epochs.png")
 plt.show()
 
 # Save logs
-with open("train_logs_scratch.json", "w") as f:
+with open(f"train_logs_scratch{SUFFIX}.json", "w") as f:
     json.dump(trainer.state.log_history, f)
 
 # Savie tokens after train/validation split for analysis
-with open("../data/train_tokens.txt", "w") as f:
-    for ex in train_dataset:
-        f.write(ex["text"] + "\n")
-
-with open("../data/eval_tokens.txt", "w") as f:
-    for ex in eval_dataset:
-        f.write(ex["text"] + "\n")
\ No newline at end of file
+if USE_TOKEN_IDS:
+    # Index rows of each split; the eval scripts read eval_index.npy with the same token file
+    np.save("../data/train_index.npy", token_index[np.array(train_dataset["row"], dtype=np.int64)])
+    np.save("../data/eval_index.npy", token_index[np.array(eval_dataset["row"], dtype=np.int64)])
+else:
+    with open("../data/train_tokens.txt", "w") as f:
+        for ex in train_dataset:
+            f.write(ex["text"] + "\n")
+
+    with open("../data/eval_tokens.txt", "w") as f:
+        for ex in eval_dataset:
+            f.write(ex["text"] + "\n")
\ No newline at end of file